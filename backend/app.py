@@ -1,45 +1,128 @@
 import os
-import json
 import datetime
-from flask import Flask, jsonify, abort, request, make_response
+from flask import Blueprint, Flask, Response, current_app, jsonify, abort, request, make_response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from jose import jwt
 from auth import AuthError, requires_auth, requires_role
+from metrics import init_metrics, registry, timed
+from profiling import init_profiling, profiles
 
 from werkzeug.exceptions import HTTPException
 
-from database.models import db, setup_db, User, Question, Answer, Vote, Article
-
-app = Flask(__name__)
-setup_db(app)
+from database.models import db, setup_db, User, Question, Answer, Article, Tag, QuestionTag
+from database.loading import (load, QUESTION_LIST, QUESTION_DETAIL, ANSWER_LIST,
+                              ARTICLE_LIST, ARTICLE_DETAIL)
+from database.statements import statement_budget
+from database.projections import question_summaries, article_summaries, authored_article_summaries
+from database.pool import pool_status
+from database.routing import read_only
+from database.votes import cast_vote
+from pagination import paginate, sort_order
+from streaming import stream_json
+from serialization import create_json_provider, QuestionSummary, AnswerSummary, ArticleSummary
+from search import search, author_match, articles_by_author, questions_by_tag
+from hashing import HashingBusy, login_limiter
+from cache import cached
+from bulk import KINDS, BULK_BATCH_SIZE, bulk_cli, import_ndjson, export_ndjson
+from conditional import conditional, question_etag, answers_etag, article_etag
+
+# Old clients expect PATCH /questions/<id> and PATCH /articles/<id> to answer
+# with the whole table; they get it while this is set.
+LEGACY_PATCH_RESPONSES = os.environ.get(
+    'LEGACY_PATCH_RESPONSES', 'false').lower() in ('1', 'true', 'yes', 'on')
+# Create missing tables when the app is built. server.py checks the schema
+# once, in its master process, and builds the app its workers share.
+DB_CREATE_SCHEMA = os.environ.get('DB_CREATE_SCHEMA', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+api = Blueprint('api', __name__)
 #Apply Migrations
-migrate = Migrate(app, db)
+migrate = Migrate()
 
-CORS(app)  # This will enable CORS for all routes
-# db.create_all()
+"""
+create_app(config)
+    the Flask app, configured from the environment and then from the
+    `config` mapping. `DATABASE` in it is a URI or a DatabaseConfig.
 
-QUESTIONS_PER_PAGE = 10
+    app = create_app({'DATABASE': 'sqlite:///stc.db', 'DB_CREATE_SCHEMA': False})
+"""
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['LEGACY_PATCH_RESPONSES'] = LEGACY_PATCH_RESPONSES
+    app.config['DB_CREATE_SCHEMA'] = DB_CREATE_SCHEMA
+    app.config.update(config or {})
+
+    app.json = create_json_provider(app)
+    init_metrics(app)
+    init_profiling(app)
+    setup_db(app, app.config.get('DATABASE'), create_schema=app.config['DB_CREATE_SCHEMA'])
+    migrate.init_app(app, db)
+
+    CORS(app)  # This will enable CORS for all routes
+    app.cli.add_command(bulk_cli)
+    app.register_blueprint(api)
+    return app
+
+# `?sort=` options of the listing endpoints: (key columns, descending).
+# Every key is backed by a B-tree index of the same columns.
+QUESTION_SORTS = {
+    'oldest': ((Question.created_at, Question.id), False),
+    'newest': ((Question.created_at, Question.id), True),
+    'top': ((Question.answer_count, Question.id), True),
+}
+ANSWER_SORTS = {
+    'oldest': ((Answer.created_at, Answer.id), False),
+    'newest': ((Answer.created_at, Answer.id), True),
+    'top': ((Answer.upvote_count, Answer.id), True),
+}
+ARTICLE_SORTS = {
+    'oldest': ((Article.created_at, Article.id), False),
+    'newest': ((Article.created_at, Article.id), True),
+}
 
-def paginate(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + 10
+"""
+patch_include()
+    what a PATCH response carries besides the updated resource, checked
+    before anything is written: `none`, `list` (one page of the listing, with
+    `sort` and `cursor`) or `all` (the whole listing, the default under
+    LEGACY_PATCH_RESPONSES).
+"""
+def patch_include():
+    default = 'all' if current_app.config['LEGACY_PATCH_RESPONSES'] else 'none'
+    include = request.args.get('include', default)
+    if include not in ('none', 'list', 'all'):
+        abort(400)
+    return include
 
-    formatted_questions = [entity.short_format() for entity in selection]
-    current_questions = formatted_questions[start:end]
+"""
+updated_response(include, name, resource, query, formatter, sorts)
+    the body of a PATCH: the updated resource under `name`, plus the listing
+    asked for by patch_include().
+"""
+def updated_response(include, name, resource, query, formatter, sorts):
+    payload = {'success': True, name: formatter(resource)}
 
-    return current_questions
+    if include == 'none':
+        return jsonify(payload)
 
-@app.route('/public', methods=['GET'])
+    if include == 'list':
+        order, descending = sort_order(request, sorts, 'oldest')
+        payload[name + 's'], page = paginate(
+            request, query, order, formatter, descending, cursor_arg='cursor')
+        payload.update(page)
+        return jsonify(payload)
+
+    return stream_json(payload, name + 's', query.order_by(sorts['oldest'][0][-1]), formatter)
+
+@api.route('/public', methods=['GET'])
 def public():
     return jsonify({
         'message': 'Public Endpoint',
         "success": True,
     })
 
-@app.route('/private', methods=['GET'])
+@api.route('/private', methods=['GET'])
 @requires_auth
 def private(token):
     return jsonify({'message': 'Private Endpoint','token': token})
@@ -47,23 +130,19 @@ def private(token):
 #----------------------------------------------------------------------------#
 # READ USERS.
 #----------------------------------------------------------------------------#
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 @requires_auth
 @requires_role(roles=['manager', 'staff'])
 def users(token):
-    users = User.query.all()
-
-    return jsonify({
-        'success': True,
-        'token': token,
-        'users': [user.long() for user in users]
-    })
+    return stream_json(
+        {'success': True, 'token': token},
+        'users', User.query.order_by(User.id), User.long)
 #----------------------------------------------------------------------------
 
 #----------------------------------------------------------------------------#
 # CREATE USER : REGISTER.
 #----------------------------------------------------------------------------#
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 @requires_auth
 def create_user(payload):
     #grab post arguments
@@ -99,7 +178,7 @@ def create_user(payload):
 #----------------------------------------------------------------------------#
 # UPDATE USER
 #----------------------------------------------------------------------------#
-@app.route('/users/<int:user_id>', methods=['PATCH'])
+@api.route('/users/<int:user_id>', methods=['PATCH'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def update_user(payload, user_id):
@@ -142,7 +221,7 @@ def update_user(payload, user_id):
 #----------------------------------------------------------------------------#
 # DELETE USER.
 #----------------------------------------------------------------------------#
-@app.route('/users/<int:user_id>', methods=['DELETE'])
+@api.route('/users/<int:user_id>', methods=['DELETE'])
 @requires_auth
 @requires_role(roles=['manager']) 
 def delete_user(token,user_id):
@@ -163,9 +242,16 @@ def delete_user(token,user_id):
 # LOGIN.
 #----------------------------------------------------------------------------#
 
-@app.route('/token', methods=['GET'])
+@api.route('/token', methods=['GET'])
 def login():
     auth = request.authorization
+    attempt = (request.remote_addr, auth.username) if auth else None
+
+    if auth and not login_limiter.allow(attempt):
+        raise AuthError({
+            'code': 'too_many_attempts',
+            'description': 'Too many login attempts, try again later.'
+        }, 429)
     
     try:
         user = User.query.filter(User.username == auth.username).first()
@@ -175,14 +261,18 @@ def login():
             "description": f'Could not find user with username {auth.username}'
         }, 422)
     
-    if auth and user.is_authenticated(auth.password):
-        token = jwt.encode({
-            'role': user.role,
-            'user': user.short(),
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24),
-        },os.environ['SECRET_KEY'])
+    if auth and user is not None and user.is_authenticated(auth.password):
+        login_limiter.reset(attempt)
+        with timed('jwt'):
+            token = jwt.encode({
+                'role': user.role,
+                'user': user.short(),
+                'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24),
+            },os.environ['SECRET_KEY'])
         return jsonify({'token' : token})
     else:
+        if auth:
+            login_limiter.fail(attempt)
         raise AuthError({
             'code': 'authenticaion failed',
             f'description': 'Could not authenticate user.'
@@ -192,27 +282,36 @@ def login():
 #----------------------------------------------------------------------------#
 # READ QUESTIONS.
 #----------------------------------------------------------------------------#
-@app.route('/questions', methods=['GET'])
+@api.route('/questions', methods=['GET'])
+@read_only
+@cached('questions')
+@statement_budget(2)
 def get_questions():
-    questions = Question.query.all()
-
-    paginated_questions = paginate(request, questions)
+    order, descending = sort_order(request, QUESTION_SORTS, 'oldest')
+    rows, page = paginate(request, question_summaries(), order, None, descending)
+    paginated_questions = QuestionSummary.from_rows(rows)
 
     # if paginated_questions == []:
     #         abort(404)
 
     return jsonify({
         'success': True,
-        'questions': paginated_questions
+        'questions': paginated_questions,
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # QUESTION DETAIL.
 #----------------------------------------------------------------------------#
-@app.route('/questions/<id>', methods=['GET'])
+@api.route('/questions/<int:id>', methods=['GET'])
+@read_only
+@cached('question:{id}')
+@conditional(question_etag)
+@statement_budget(3)
 def question_detail(id):
-    question = Question.query.filter(Question.id == id).first()
+    question = load(Question.query, QUESTION_DETAIL).filter(Question.id == id).first()
 
     if question is None:
         abort(404)
@@ -226,7 +325,7 @@ def question_detail(id):
 #----------------------------------------------------------------------------#
 # CREATE QUESTIONS.
 #----------------------------------------------------------------------------#
-@app.route('/questions', methods=['POST'])
+@api.route('/questions', methods=['POST'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def create_questions(token):
@@ -237,14 +336,14 @@ def create_questions(token):
     body = data.get("body", None)
     tags = data.get("tags", None)
 
-    if title is None or body is None or tags is None:
+    if title is None or body is None or not isinstance(tags, list):
         abort(400)
 
     try:
         question = Question(
             title = title,
             body = body,
-            tag = json.dumps(tags),
+            tags = tags,
             user_id = token['user']['id']
         )
         question.insert()
@@ -260,10 +359,11 @@ def create_questions(token):
 #----------------------------------------------------------------------------#
 # UPDATE QUESTIONS.
 #----------------------------------------------------------------------------#
-@app.route('/questions/<id>', methods=['PATCH'])
+@api.route('/questions/<int:id>', methods=['PATCH'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def update_questions(token,id):
+    include = patch_include()
     question = Question.query.filter(Question.id == id).first()
 
     if question is None:
@@ -279,36 +379,39 @@ def update_questions(token,id):
     body = data.get("body", None)
     tags = data.get("tags", None)
 
-    if title is None or body is None or tags is None:
+    if title is None or body is None or not isinstance(tags, list):
         abort(400)
 
     try:
         question.title = title
         question.body = body
-        question.tag = json.dumps(tags)
+        question.set_tags(tags)
         question.update()
     except:
         abort(404)
 
-    questions = Question.query.all()
+    questions = load(Question.query, QUESTION_LIST)
+    question = questions.filter(Question.id == question.id).one()
 
-    return jsonify({
-        'success': True,
-        'questions': [question.short_format() for question in questions]
-    })
+    return updated_response(include, 'question', question, questions, Question.short_format, QUESTION_SORTS)
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # DELETE QUESTIONS.
 #----------------------------------------------------------------------------#
-@app.route('/questions/<id>', methods=['DELETE'])
+@api.route('/questions/<int:id>', methods=['DELETE'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def delete_questions(token, id):
     try:
         question = Question.query.filter(Question.id == id).first()
+        if question is None:
+            abort(404)
+
         # Allowing only the right user to delete his/her question.
         if token['role'] == 'manager' or token['user']['id'] == question.user_id:
+            # Rendered before the delete expires the row.
+            deleted = question.short_format()
             question.delete()
         else:
             abort(401)
@@ -319,54 +422,91 @@ def delete_questions(token, id):
 
     return jsonify({
         'success': True,
-        'questions': question.short_format()
+        'questions': deleted
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # SEARCH QUESTIONS.
 #----------------------------------------------------------------------------#
-@app.route('/search-questions/', methods=['GET'])
+@api.route('/search-questions/', methods=['GET'])
+@read_only
+@statement_budget(4)
 def search_questions():
     search_term = request.args.get('search', None)
 
     if search_term is None:
         abort(404)
 
-    questions = Question.query.filter(
-            Question.title.ilike('%'+search_term+'%') | 
-            Question.body.ilike('%'+search_term+'%') |
-            Question.tag.ilike('%'+search_term+'%')
-        )
+    rows, page = search(
+        request, question_summaries(), Question, search_term,
+        extra=questions_by_tag(search_term))
 
     return jsonify({
         'success': True,
         'search_term': search_term,
-        'questions': [question.short_format() for question in questions]
+        'questions': QuestionSummary.from_rows(rows),
+        'has_more': page['has_more'],
+        'page': page['page'],
+    })
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# QUESTIONS BY TAG.
+#----------------------------------------------------------------------------#
+@api.route('/tags/<name>/questions', methods=['GET'])
+@read_only
+@cached('questions')
+@statement_budget(2)
+def tagged_questions(name):
+    # Walks the (tag_id, question_id) index instead of matching serialized tags.
+    questions = (question_summaries()
+        .join(QuestionTag, QuestionTag.question_id == Question.id)
+        .join(Tag, QuestionTag.tag_id == Tag.id)
+        .filter(Tag.name == Tag.normalize(name)))
+
+    order, descending = sort_order(request, QUESTION_SORTS, 'oldest')
+    rows, page = paginate(request, questions, order, None, descending)
+    paginated_questions = QuestionSummary.from_rows(rows)
+
+    return jsonify({
+        'success': True,
+        'tag': Tag.normalize(name),
+        'questions': paginated_questions,
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # READ ANSWERS.
 #----------------------------------------------------------------------------#
-@app.route('/questions/<question_id>/answers', methods=['GET'])
+@api.route('/questions/<int:question_id>/answers', methods=['GET'])
+@read_only
+@cached('answers:{question_id}')
+@conditional(answers_etag)
+@statement_budget(1)
 def get_answers(question_id):
+    order, descending = sort_order(request, ANSWER_SORTS, 'oldest')
     try:
-        answers = Answer.query.filter(Answer.question_id == question_id)
+        answers = (load(Answer.query, ANSWER_LIST)
+            .filter(Answer.question_id == question_id)
+            .order_by(*[column.desc() if descending else column for column in order])
+            .all())
     except:
         abort(404)
 
     return jsonify({
         'success': True,
-        'answers': [answer.format() for answer in answers],
-        'count': answers.count()
+        'answers': [AnswerSummary.from_entity(answer) for answer in answers],
+        'count': len(answers)
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # CREATE ANWERS.
 #----------------------------------------------------------------------------#
-@app.route('/questions/<question_id>/answers', methods=['POST'])
+@api.route('/questions/<int:question_id>/answers', methods=['POST'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def create_answers(token,question_id):
@@ -397,7 +537,7 @@ def create_answers(token,question_id):
 #----------------------------------------------------------------------------#
 # UPDATE ANWERS.
 #----------------------------------------------------------------------------#
-@app.route('/answers/<answer_id>', methods=['PATCH'])
+@api.route('/answers/<int:answer_id>', methods=['PATCH'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def update_answers(token,answer_id):
@@ -431,106 +571,87 @@ def update_answers(token,answer_id):
 #----------------------------------------------------------------------------#
 # UPDATE VOTE : UPVOTE
 #----------------------------------------------------------------------------#
-@app.route('/answers/<answer_id>/upvote', methods=['GET'])
+@api.route('/answers/<int:answer_id>/upvote', methods=['GET'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def upvote_answers(token,answer_id):
-    try:
-        user_id = token['user']['id'] # currently logged in user.
-        answer = Answer.query.filter(Answer.id == answer_id).first()
+    user_id = token['user']['id'] # currently logged in user.
 
-        if user_id == answer.user_id:
-            abort(400)
-        
-        # Check if user already placed a vote for this particular answer.
-        vote = Vote.query.filter(Vote.user_id == user_id, Vote.answer_id == answer_id).first()
-        
-        if vote is None:
-            # Create Vote instance for user.
-            upvote = Vote(upvote = True, answer_id = answer_id, user_id = user_id).insert()
-        elif vote and vote.downvote: # Allows user update their vote.
-            vote.upvote = True
-            vote.downvote = False
-            vote.update()
-            
-        # Calculate number of upvotes and downvotes for an answer.
-        upvotes = Vote.query.filter(Vote.answer_id == answer_id, Vote.upvote == True).count()
-        downvotes = Vote.query.filter(Vote.answer_id == answer_id, Vote.downvote == True).count()
-    except HTTPException as error:
-        if error.code == 400:
-            abort(400)
-        abort(422)
+    # Records the vote (or flips an earlier opposite vote) and reads back the
+    # answer's tallies in a single statement.
+    tally = cast_vote(answer_id, user_id, upvote = True)
+
+    if tally is None:
+        abort(404)
+
+    if user_id == tally.owner_id:
+        abort(400)
 
     return jsonify({
         "success": True,
         "answer": answer_id,
-        "upvotes": upvotes,
-        "downvotes": downvotes,
+        "upvotes": tally.upvotes,
+        "downvotes": tally.downvotes,
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # UPDATE VOTE : DOWNVOTE
 #----------------------------------------------------------------------------#
-@app.route('/answers/<answer_id>/downvote', methods=['GET'])
+@api.route('/answers/<int:answer_id>/downvote', methods=['GET'])
 @requires_auth
 @requires_role(roles=['manager', 'staff', 'student'])
 def downvote_answers(token,answer_id):
-    try:
-        user_id = token['user']['id'] # currently logged in user.
-        answer = Answer.query.filter(Answer.id == answer_id).first()
+    user_id = token['user']['id'] # currently logged in user.
 
-        if user_id == answer.user_id:
-            abort(400)
-        
-        # Check if user already placed a vote for this particular answer.
-        vote = Vote.query.filter(Vote.user_id == user_id, Vote.answer_id == answer_id).first()
-        
-        if vote is None:
-            # Create Vote instance for user.
-            downvote = Vote(downvote = True, answer_id = answer_id, user_id = user_id).insert()
-        elif vote and vote.upvote: # Allows user update their vote.
-            vote.upvote = False
-            vote.downvote = True
-            vote.update()
-            
-        # Calculate number of upvotes and downvotes for an answer.
-        upvotes = Vote.query.filter(Vote.answer_id == answer_id, Vote.upvote == True).count()
-        downvotes = Vote.query.filter(Vote.answer_id == answer_id, Vote.downvote == True).count()
-    except HTTPException as error:
-        if error.code == 400:
-            abort(400)
-        abort(422)
+    # Records the vote (or flips an earlier opposite vote) and reads back the
+    # answer's tallies in a single statement.
+    tally = cast_vote(answer_id, user_id, upvote = False)
+
+    if tally is None:
+        abort(404)
+
+    if user_id == tally.owner_id:
+        abort(400)
 
     return jsonify({
         "success": True,
         "answer": answer_id,
-        "upvotes": upvotes,
-        "downvotes": downvotes,
+        "upvotes": tally.upvotes,
+        "downvotes": tally.downvotes,
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # READ ARTICLES.
 #----------------------------------------------------------------------------#
-@app.route('/articles', methods=['GET'])
+@api.route('/articles', methods=['GET'])
+@read_only
+@cached('articles')
+@statement_budget(1)
 def get_articles():
-    articles = Article.query.all()
-
-    paginated_articles = paginate(request, articles)
+    order, descending = sort_order(request, ARTICLE_SORTS, 'oldest')
+    paginated_articles, page = paginate(
+        request, article_summaries(), order, ArticleSummary.from_row, descending)
 
     return jsonify({
         'success': True,
-        'articles': paginated_articles
+        'articles': paginated_articles,
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
     })
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # ARTICLE DETAIL.
 #----------------------------------------------------------------------------#
-@app.route('/articles/<id>', methods=['GET'])
+@api.route('/articles/<int:id>', methods=['GET'])
+@read_only
+@cached('article:{id}')
+@conditional(article_etag)
+@statement_budget(1)
 def article_detail(id):
-    article = Article.query.filter(Article.id == id).first()
+    article = load(Article.query, ARTICLE_DETAIL).filter(Article.id == id).first()
 
     if article is None:
         abort(404)
@@ -544,7 +665,7 @@ def article_detail(id):
 #----------------------------------------------------------------------------#
 # CREATE ARTICLES.
 #----------------------------------------------------------------------------#
-@app.route('/articles', methods=['POST'])
+@api.route('/articles', methods=['POST'])
 @requires_auth
 @requires_role(roles=['manager', 'staff'])
 def create_articles(token):
@@ -575,10 +696,11 @@ def create_articles(token):
 #----------------------------------------------------------------------------#
 # UPDATE ARTICLES.
 #----------------------------------------------------------------------------#
-@app.route('/articles/<id>', methods=['PATCH'])
+@api.route('/articles/<int:id>', methods=['PATCH'])
 @requires_auth
 @requires_role(roles=['manager', 'staff'])
 def update_articles(token,id):
+    include = patch_include()
     article = Article.query.filter(Article.id == id).first()
 
     if article is None:
@@ -599,23 +721,20 @@ def update_articles(token,id):
     try:
         article.title = title
         article.body = body
-        article.updated_on = datetime.datetime.now().strftime("%B %d, %Y | %H:%M:%S")
         article.update()
     except:
         abort(422)
 
-    articles = Article.query.all()
+    articles = load(Article.query, ARTICLE_LIST)
+    article = articles.filter(Article.id == article.id).one()
 
-    return jsonify({
-        'success': True,
-        'articles': [article.short_format() for article in articles]
-    })
+    return updated_response(include, 'article', article, articles, Article.short_format, ARTICLE_SORTS)
 #----------------------------------------------------------------------------#
 
 #----------------------------------------------------------------------------#
 # DELETE ARTICLES.
 #----------------------------------------------------------------------------#
-@app.route('/articles/<id>', methods=['DELETE'])
+@api.route('/articles/<int:id>', methods=['DELETE'])
 @requires_auth
 @requires_role(roles=['manager', 'staff'])
 def delete_articles(token, id):
@@ -643,23 +762,122 @@ def delete_articles(token, id):
 #----------------------------------------------------------------------------#
 # SEARCH ARTICLES.
 #----------------------------------------------------------------------------#
-@app.route('/search-articles/', methods=['GET'])
+@api.route('/search-articles/', methods=['GET'])
+@read_only
+@statement_budget(3)
 def search_articles():
     search_term = request.args.get('search', None)
+    author = request.args.get('author', None)
 
-    if search_term is None:
+    if search_term is None and author is None:
         abort(404)
 
-    articles = Article.query.filter(
-        Article.title.ilike('%'+search_term+'%') | 
-        Article.body.ilike('%'+search_term+'%') |
-        User.username.ilike('%'+search_term+'%')
-    )
+    # Each article joins exactly one author, so rows are never duplicated.
+    if search_term is None:
+        order, descending = sort_order(request, ARTICLE_SORTS, 'oldest')
+        paginated_articles, page = paginate(
+            request, authored_article_summaries(author_match(author)), order,
+            ArticleSummary.from_row, descending)
+
+        return jsonify({
+            'success': True,
+            'author': author,
+            'articles': paginated_articles,
+            'has_more': page['has_more'],
+            'next_cursor': page['next_cursor'],
+        })
+
+    articles, page = search(
+        request, article_summaries(), Article, search_term,
+        extra=articles_by_author(search_term))
 
     return jsonify({
         'success': True,
         'search_term': search_term,
-        'articles': [article.short_format() for article in articles]
+        'articles': ArticleSummary.from_rows(articles),
+        'has_more': page['has_more'],
+        'page': page['page'],
+    })
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# BULK IMPORT.
+#----------------------------------------------------------------------------#
+@api.route('/bulk/<name>', methods=['POST'])
+@requires_auth
+@requires_role(roles=['manager'])
+def bulk_import(token, name):
+    if name not in KINDS:
+        abort(404)
+
+    # The body is NDJSON, read line by line rather than loaded whole.
+    report = import_ndjson(name, request.stream, token['user']['id'],
+                           request.args.get('batch_size', BULK_BATCH_SIZE, type=int))
+
+    return jsonify({
+        'success': report['failed'] == 0,
+        **report,
+    })
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# BULK EXPORT.
+#----------------------------------------------------------------------------#
+@api.route('/bulk/<name>', methods=['GET'])
+@read_only
+@requires_auth
+@requires_role(roles=['manager'])
+def bulk_export(token, name):
+    if name not in KINDS:
+        abort(404)
+
+    return Response(stream_with_context(export_ndjson(name)), mimetype='application/x-ndjson')
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# DATABASE POOL STATUS.
+#----------------------------------------------------------------------------#
+@api.route('/database/pool', methods=['GET'])
+@requires_auth
+@requires_role(roles=['manager'])
+def database_pool(token):
+    return jsonify({
+        'success': True,
+        'pool': pool_status(db.engine),
+        'replicas': {key: pool_status(engine) for key, engine in db.engines.items() if key is not None},
+    })
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# METRICS.
+#----------------------------------------------------------------------------#
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+#----------------------------------------------------------------------------#
+
+#----------------------------------------------------------------------------#
+# PROFILES.
+#----------------------------------------------------------------------------#
+@api.route('/profiles', methods=['GET'])
+@requires_auth
+@requires_role(roles=['manager'])
+def list_profiles(token):
+    return jsonify({
+        'success': True,
+        'profiles': profiles.list(request.args.get('route', None)),
+    })
+
+@api.route('/profiles/<uuid:profile_id>', methods=['GET'])
+@requires_auth
+@requires_role(roles=['manager'])
+def download_profile(token, profile_id):
+    profile = profiles.get(profile_id)
+    if profile is None:
+        abort(404)
+
+    return Response(profile['collapsed'], mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.folded',
     })
 #----------------------------------------------------------------------------#
 
@@ -667,7 +885,15 @@ def search_articles():
 """
     ERROR HANDLERS
 """
-@app.errorhandler(AuthError)
+@api.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    return jsonify({
+        "success": False,
+        "error": 503,
+        "message": "service_unavailable"
+        }), 503
+
+@api.app_errorhandler(AuthError)
 def autherror(AuthError):
     return jsonify({
         'success': False,
@@ -675,7 +901,7 @@ def autherror(AuthError):
         'message': AuthError.error['description'],
         }), AuthError.status_code
 
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request(error):
     return jsonify({
         "success": False,
@@ -683,7 +909,7 @@ def bad_request(error):
         "message": "bad_request"
         }), 400
 
-@app.errorhandler(401)
+@api.app_errorhandler(401)
 def not_found(error):
     return jsonify({
         'success': False,
@@ -691,7 +917,7 @@ def not_found(error):
         'message': 'Unauthorized'
     }), 401
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def page_not_found(error):
     return jsonify({
         "success": False,
@@ -699,7 +925,7 @@ def page_not_found(error):
         "message": "resource not found"
         }), 404
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def method_not_allowed(error):
     return jsonify({
         "success": False,
@@ -707,7 +933,7 @@ def method_not_allowed(error):
         "message": "method_not_allowed"
         }), 405
 
-@app.errorhandler(422)
+@api.app_errorhandler(422)
 def unprocessable(error):
     return jsonify({
         "success": False,
@@ -717,5 +943,5 @@ def unprocessable(error):
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
 
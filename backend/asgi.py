@@ -0,0 +1,279 @@
+import os
+import asyncio
+import contextvars
+from urllib.parse import parse_qsl
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.http import parse_cookie, parse_etags, quote_etag
+from werkzeug.routing import Map, Rule
+
+from app import create_app, QUESTION_SORTS, ANSWER_SORTS, ARTICLE_SORTS
+from conditional import question_state, answers_state, article_state, state_etag
+from database.config import DatabaseConfig
+from database.loading import load, QUESTION_DETAIL, ANSWER_LIST, ARTICLE_DETAIL
+from database.models import Question, QuestionTag, Tag, Answer, Article
+from database.projections import (question_summaries_select, article_summaries_select,
+                                  tags_select, group_tags)
+from database.routing import balancer, pinned_to_primary
+from hashing import hasher
+from pagination import sort_order, page_query, page_rows
+from serialization import QuestionSummary, AnswerSummary, ArticleSummary
+
+"""
+ASGI entry point.
+
+    uvicorn asgi:create_application --factory --app-dir backend
+    python backend/server.py --asgi
+
+The read endpoints below run as coroutines on an async SQLAlchemy engine
+(asyncpg for PostgreSQL, aiosqlite for SQLite), so one process keeps serving
+while hundreds of clients wait on slow queries or slow networks. They answer
+exactly as their Flask views do, ETags and 304s included, and read from a
+replica under the same rules as @read_only views. They skip the response
+cache and the request metrics.
+
+Every other request, and any read that ends in an error, is handed to the
+Flask app, which runs in a thread per request as under a WSGI server. Set
+ASYNC_READS=false to send everything to Flask.
+
+The async engines are configured from the same environment as setup_db().
+An in-memory SQLite database cannot be shared with them; use a file.
+"""
+ASYNC_READS = os.environ.get('ASYNC_READS', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+
+class AsyncRequest:
+
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(name.decode('latin-1'), value.decode('latin-1'))
+                                for name, value in scope['headers']])
+        self.cookies = parse_cookie(self.headers.get('Cookie', ''))
+
+    def not_modified(self, etag):
+        return etag is not None and parse_etags(self.headers.get('If-None-Match')).contains(etag)
+
+"""
+AsyncDatabase
+    async engines for the primary and the replicas of a DatabaseConfig.
+"""
+class AsyncDatabase:
+
+    def __init__(self, config=None):
+        config = config or DatabaseConfig()
+        self.primary = self._engine(config, config.uri)
+        self.replicas = [self._engine(config, uri) for uri in config.replicas]
+
+    @staticmethod
+    def _engine(config, uri):
+        engine = create_async_engine(config.async_uri(uri), **config.async_engine_options(uri))
+        config.configure(engine.sync_engine)
+        return engine
+
+    def session(self, request):
+        # Same rule as RoutingSession: a client that just wrote reads the primary.
+        if self.replicas and not pinned_to_primary(request.cookies):
+            return AsyncSession(balancer.choose(self.replicas))
+        return AsyncSession(self.primary)
+
+    async def dispose(self):
+        for engine in [self.primary, *self.replicas]:
+            await engine.dispose()
+
+
+async def paginate(request, session, statement, order, descending):
+    rows = (await session.execute(page_query(request, statement, order, descending))).all()
+    return page_rows(rows, order, None)
+
+async def question_summaries(session, rows):
+    ids = [row.id for row in rows]
+    tags = group_tags(ids, (await session.execute(tags_select(ids))).all()) if ids else {}
+    return QuestionSummary.from_rows(rows, tags)
+
+async def etag_for(session, name, id, statement):
+    return state_etag(name, id, (await session.execute(statement)).first())
+
+"""
+Handlers
+    coroutines of (request, session, **route arguments) returning
+    (status, payload, etag). They mirror the views of the same name in app.py.
+"""
+async def get_questions(request, session):
+    order, descending = sort_order(request, QUESTION_SORTS, 'oldest')
+    rows, page = await paginate(request, session, question_summaries_select(), order, descending)
+
+    return 200, {
+        'success': True,
+        'questions': await question_summaries(session, rows),
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
+    }, None
+
+async def question_detail(request, session, id):
+    etag = await etag_for(session, 'question', id, question_state(id))
+    if request.not_modified(etag):
+        return 304, None, etag
+
+    question = (await session.execute(
+        load(select(Question), QUESTION_DETAIL).where(Question.id == id))).scalars().first()
+    if question is None:
+        raise NotFound()
+
+    return 200, {
+        'success': True,
+        'question': question.long_format(),
+    }, etag
+
+async def tagged_questions(request, session, name):
+    questions = (question_summaries_select()
+        .join(QuestionTag, QuestionTag.question_id == Question.id)
+        .join(Tag, QuestionTag.tag_id == Tag.id)
+        .where(Tag.name == Tag.normalize(name)))
+
+    order, descending = sort_order(request, QUESTION_SORTS, 'oldest')
+    rows, page = await paginate(request, session, questions, order, descending)
+
+    return 200, {
+        'success': True,
+        'tag': Tag.normalize(name),
+        'questions': await question_summaries(session, rows),
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
+    }, None
+
+async def get_answers(request, session, question_id):
+    etag = await etag_for(session, 'answers', question_id, answers_state(question_id))
+    if request.not_modified(etag):
+        return 304, None, etag
+
+    order, descending = sort_order(request, ANSWER_SORTS, 'oldest')
+    answers = (await session.execute(load(select(Answer), ANSWER_LIST)
+        .where(Answer.question_id == question_id)
+        .order_by(*[column.desc() if descending else column for column in order]))).scalars().all()
+
+    return 200, {
+        'success': True,
+        'answers': [AnswerSummary.from_entity(answer) for answer in answers],
+        'count': len(answers)
+    }, etag
+
+async def get_articles(request, session):
+    order, descending = sort_order(request, ARTICLE_SORTS, 'oldest')
+    rows, page = await paginate(request, session, article_summaries_select(), order, descending)
+
+    return 200, {
+        'success': True,
+        'articles': ArticleSummary.from_rows(rows),
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor'],
+    }, None
+
+async def article_detail(request, session, id):
+    etag = await etag_for(session, 'article', id, article_state(id))
+    if request.not_modified(etag):
+        return 304, None, etag
+
+    article = (await session.execute(
+        load(select(Article), ARTICLE_DETAIL).where(Article.id == id))).scalars().first()
+    if article is None:
+        raise NotFound()
+
+    return 200, {
+        'success': True,
+        'article': article.format()
+    }, etag
+
+HANDLERS = {
+    '/questions': get_questions,
+    '/questions/<int:id>': question_detail,
+    '/tags/<name>/questions': tagged_questions,
+    '/questions/<int:question_id>/answers': get_answers,
+    '/articles': get_articles,
+    '/articles/<int:id>': article_detail,
+}
+
+"""
+AsyncReads
+    the ASGI application: async handlers for the routes in HANDLERS, the
+    Flask app for everything else.
+"""
+class AsyncReads:
+
+    def __init__(self, flask_app, enabled=ASYNC_READS, database=None):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.enabled = enabled
+        self.database = (database or AsyncDatabase()) if enabled else None
+        self.routes = Map([Rule(rule, endpoint=rule, methods=['GET']) for rule in HANDLERS])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and self.enabled and await self.serve(scope, send):
+            return
+
+        # Started in an empty context: servers may start a request from inside
+        # the previous one's task on the same connection, whose thread is gone.
+        await contextvars.Context().run(asyncio.ensure_future, self.call_flask(scope, receive, send))
+
+    async def call_flask(self, scope, receive, send):
+        # A thread of its own per request, as a threaded WSGI server would.
+        async with ThreadSensitiveContext():
+            await self.wsgi(scope, receive, send)
+
+    async def serve(self, scope, send):
+        if scope['method'] != 'GET':
+            return False
+        try:
+            rule, arguments = self.routes.bind('').match(scope['path'], method='GET')
+        except HTTPException:
+            return False
+
+        request = AsyncRequest(scope)
+        try:
+            async with self.database.session(request) as session:
+                status, payload, etag = await HANDLERS[rule](request, session, **arguments)
+        except HTTPException:
+            # Flask renders errors exactly as it always has.
+            return False
+
+        body = self.flask_app.json.dumps(payload).encode() if payload is not None else b''
+        headers = [(b'content-length', str(len(body)).encode())]
+        if payload is not None:
+            headers.append((b'content-type', b'application/json'))
+        if etag is not None:
+            headers.append((b'etag', quote_etag(etag).encode()))
+        if 'Origin' in request.headers:
+            # As flask-cors answers for the Flask routes.
+            headers.append((b'access-control-allow-origin', b'*'))
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return True
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.database is not None:
+                    await self.database.dispose()
+                # Uvicorn ends the process by re-raising the shutdown signal,
+                # so atexit handlers never stop the bcrypt pool.
+                hasher.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+"""
+create_application(config=None)
+    AsyncReads in front of create_app(config).
+"""
+def create_application(config=None):
+    return AsyncReads(create_app(config))
@@ -1,12 +1,20 @@
 import os
-from flask import request,abort
+import time
+import threading
+from collections import OrderedDict
+from flask import request,abort,g
 from jose import jwt
 from secrets import token_urlsafe
 from functools import wraps
 import hashlib
 
-#Generates a random URL-safe text string, in Base64 encoding.
-os.environ['SECRET_KEY'] = token_urlsafe(20)
+from metrics import timed
+
+# Tokens are signed with SECRET_KEY. When it is unset, a random URL-safe key
+# is generated for this process and the processes it forks, such as the
+# workers of server.py. Processes started any other way need the same key
+# set in their environment to accept each other's tokens.
+os.environ.setdefault('SECRET_KEY', token_urlsafe(20))
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -65,25 +73,94 @@ def check_roles(roles, payload):
 
     return True
 
+"""
+TokenCache
+    bounded LRU of already verified tokens, keyed by the SHA-256 of the token
+    so raw credentials are never held as keys. An entry is only served until
+    the token's `exp` claim; expired entries are dropped before evicting the
+    least recently used ones.
+"""
+class TokenCache:
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            payload, expires = entry
+            if expires is not None and expires <= time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return payload
+
+    def set(self, token, payload):
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (payload, payload.get('exp'))
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.maxsize:
+                now = time.time()
+                for key, (_, stamp) in list(self.entries.items()):
+                    if stamp is not None and stamp <= now:
+                        del self.entries[key]
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+verified_tokens = TokenCache(int(os.environ.get('JWT_CACHE_SIZE', 1024)))
+
 def verify_decode_jwt(token):
-    try:
-        payload = jwt.decode(token, os.environ['SECRET_KEY'])
+    payload = verified_tokens.get(token)
+    if payload is not None:
         return payload
+
+    try:
+        with timed('jwt'):
+            payload = jwt.decode(token, os.environ['SECRET_KEY'])
     except Exception:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Unable to parse authentication token.',
         }, 401)
-    
 
+    verified_tokens.set(token, payload)
+    return payload
+
+"""
+get_token_claims()
+    the verified claims of the current request. The Authorization header is
+    parsed and the token verified once; later calls read them from flask.g.
+"""
+def get_token_claims():
+    if 'token_claims' not in g:
+        token = get_token_auth_header()
+        g.token_claims = verify_decode_jwt(token)
+    return g.token_claims
 
 
 def requires_auth(f):
     @wraps(f)
     def decorator(*args,**kwargs):
 
-        token = get_token_auth_header()        
-        data = verify_decode_jwt(token)
+        data = get_token_claims()
 
         return f(data,*args, **kwargs)
     
@@ -94,8 +171,7 @@ def requires_role(roles=[]):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = get_token_claims()
             check_roles(roles, payload)
             return f(*args, **kwargs)
 
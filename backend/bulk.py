@@ -0,0 +1,406 @@
+import os
+import re
+import json
+from datetime import datetime
+from collections import Counter, namedtuple
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select, insert, update, bindparam, func, cast
+from sqlalchemy.dialects.postgresql import REGCLASS
+from sqlalchemy.exc import IntegrityError
+
+from hashing import hasher
+from database.models import db, commit, User, Question, Tag, QuestionTag, Answer, Article
+from database.loading import load, QUESTION_EXPORT
+from search import INDEXES
+
+"""
+Bulk NDJSON import and export of users, questions, answers and articles.
+
+An import reads one JSON object per line. Rows are validated on their own,
+then checked in batches of BULK_BATCH_SIZE against the database (unique
+columns, referenced users and questions) and written with one executemany
+INSERT per batch, in one transaction per batch. A bad row is reported with its
+line number and never fails the rest of its batch. Tags, answer counts,
+password hashes, the search indexes and the response cache are maintained
+as for single writes.
+
+Rows keep the `id`, `created_at` and `updated_at` they carry, so an export
+imported into an empty database keeps its ids, its timestamps and the
+references between collections (users first, then questions, then answers
+and articles). A row whose id is taken is rejected; rows without one get a
+new id. Exported users carry no password: add a `password` or
+`password_hash` to each before importing them.
+
+An export streams every row through a server-side cursor, in id order, in
+the format an import accepts.
+"""
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 500))
+# Errors listed in an import report; the rest are only counted.
+MAX_REPORTED_ERRORS = 1000
+
+ROLES = ('manager', 'staff', 'student')
+# $2a$, $2b$ or $2y$, a two-digit cost, then 22 characters of salt and 31 of digest.
+BCRYPT_HASH = re.compile(r'\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}')
+
+
+class RowError(Exception):
+    pass
+
+
+def _text(row, name, required=True, max_length=None):
+    value = row.get(name)
+    if value is None:
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    if not isinstance(value, str) or (required and not value.strip()):
+        raise RowError(f'{name} must be a non-empty string')
+    if max_length is not None and len(value) > max_length:
+        raise RowError(f'{name} is longer than {max_length} characters')
+    return value
+
+def _id(row, name, default=None):
+    value = row.get(name, default)
+    if value is None:
+        raise RowError(f'{name} is required')
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RowError(f'{name} must be an integer')
+    return value
+
+def _kept(row, *names):
+    # The id and timestamps a row brings along, when it has them.
+    values = {}
+    if row.get('id') is not None:
+        values['id'] = _id(row, 'id')
+    for name in names:
+        if row.get(name) is not None:
+            try:
+                values[name] = datetime.fromisoformat(_text(row, name))
+            except ValueError:
+                raise RowError(f'{name} must be an ISO 8601 timestamp')
+    return values
+
+def _user(row, user_id):
+    role = _text(row, 'role')
+    if role not in ROLES:
+        raise RowError(f"role must be one of {', '.join(ROLES)}")
+
+    values = {
+        'username': _text(row, 'username', max_length=80),
+        'first_name': _text(row, 'first_name', required=False, max_length=80),
+        'last_name': _text(row, 'last_name', required=False, max_length=80),
+        'role': role,
+        'is_superuser': False,
+        'is_staff': False,
+        'is_active': True,
+        **_kept(row),
+    }
+    # Accounts moved from another system may bring their bcrypt hash along.
+    if row.get('password_hash') is not None:
+        hashed = _text(row, 'password_hash')
+        if not BCRYPT_HASH.fullmatch(hashed):
+            raise RowError('password_hash must be a bcrypt hash')
+        values['password'] = hashed
+    else:
+        values['plain_password'] = _text(row, 'password')
+    return values
+
+def _question(row, user_id):
+    tags = row.get('tags', [])
+    if not isinstance(tags, list):
+        raise RowError('tags must be a list')
+    tags = list(dict.fromkeys(Tag.normalize(name) for name in tags if Tag.normalize(name)))
+    if any(len(name) > 80 for name in tags):
+        raise RowError('tags must be at most 80 characters long')
+    return {
+        'title': _text(row, 'title', max_length=80),
+        'body': _text(row, 'body'),
+        'tags': tags,
+        'user_id': _id(row, 'user_id', user_id),
+        **_kept(row, 'created_at', 'updated_at'),
+    }
+
+def _answer(row, user_id):
+    return {
+        'body': _text(row, 'body'),
+        'question_id': _id(row, 'question_id'),
+        'user_id': _id(row, 'user_id', user_id),
+        **_kept(row, 'created_at', 'updated_at'),
+    }
+
+def _article(row, user_id):
+    return {
+        'title': _text(row, 'title', max_length=80),
+        'body': _text(row, 'body'),
+        'user_id': _id(row, 'user_id', user_id),
+        **_kept(row, 'created_at', 'updated_at'),
+    }
+
+"""
+Kind
+    how one collection is imported and exported: its model, row validator,
+    unique columns, referenced tables, and the export query and row format.
+"""
+Kind = namedtuple('Kind', ['model', 'validate', 'unique', 'references', 'export', 'dump'])
+
+KINDS = {
+    'users': Kind(
+        User, _user, ('id', 'username'), (),
+        lambda: User.query,
+        lambda user: {
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'role': user.role,
+        }),
+    'questions': Kind(
+        Question, _question, ('id', 'title', 'body'), (('user_id', User),),
+        lambda: load(Question.query, QUESTION_EXPORT),
+        lambda question: {
+            'id': question.id,
+            'title': question.title,
+            'body': question.body,
+            'tags': question.tags,
+            'user_id': question.user_id,
+            'created_at': question.created_at.isoformat(),
+            'updated_at': question.updated_at.isoformat(),
+        }),
+    'answers': Kind(
+        Answer, _answer, ('id',), (('question_id', Question), ('user_id', User)),
+        lambda: Answer.query,
+        lambda answer: {
+            'id': answer.id,
+            'body': answer.body,
+            'question_id': answer.question_id,
+            'user_id': answer.user_id,
+            'created_at': answer.created_at.isoformat(),
+            'updated_at': answer.updated_at.isoformat(),
+        }),
+    'articles': Kind(
+        Article, _article, ('id', 'title', 'body'), (('user_id', User),),
+        lambda: Article.query,
+        lambda article: {
+            'id': article.id,
+            'title': article.title,
+            'body': article.body,
+            'user_id': article.user_id,
+            'created_at': article.created_at.isoformat(),
+            'updated_at': article.updated_at.isoformat(),
+        }),
+}
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def format(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _check(kind, batch, report):
+    # Drops rows that would break a unique column or reference a missing row.
+    for column in kind.unique:
+        attribute = getattr(kind.model, column)
+        wanted = {values[column] for _, values in batch if column in values}
+        taken = set(db.session.scalars(select(attribute).where(attribute.in_(wanted))))
+
+        passed = []
+        for line, values in batch:
+            if column not in values:
+                passed.append((line, values))
+            elif values[column] in taken:
+                report.error(line, f'{column} already exists')
+            else:
+                taken.add(values[column])
+                passed.append((line, values))
+        batch = passed
+
+    for column, model in kind.references:
+        ids = {values[column] for _, values in batch}
+        found = set(db.session.scalars(select(model.id).where(model.id.in_(ids))))
+
+        passed = []
+        for line, values in batch:
+            if values[column] in found:
+                passed.append((line, values))
+            else:
+                report.error(line, f'{column} {values[column]} does not exist')
+        batch = passed
+
+    return batch
+
+def _insert(kind, batch, report):
+    # One executemany INSERT per set of columns given (rows with and without
+    # an id, say); if a concurrent writer makes it fail, rows are retried one
+    # by one to find the offending ones.
+    columns = [column.key for column in kind.model.__table__.columns]
+    statement = insert(kind.model).returning(kind.model.id, sort_by_parameter_order=True)
+    groups = {}
+    for line, values in batch:
+        row = {key: value for key, value in values.items() if key in columns}
+        groups.setdefault(frozenset(row), []).append(((line, values), row))
+
+    inserted, ids = [], []
+    for group in groups.values():
+        try:
+            with db.session.begin_nested():
+                ids.extend(db.session.scalars(statement, [row for _, row in group]))
+            inserted.extend(item for item, _ in group)
+            continue
+        except IntegrityError:
+            pass
+
+        for (line, values), row in group:
+            try:
+                with db.session.begin_nested():
+                    ids.append(db.session.scalars(statement, [row]).one())
+                inserted.append((line, values))
+            except IntegrityError as error:
+                report.error(line, str(error.orig))
+
+    # PostgreSQL would otherwise hand out the ids just imported to later rows.
+    # The sequence only moves forward: ids it handed out before stay used.
+    if (any('id' in values for _, values in inserted)
+            and db.session.get_bind().dialect.name == 'postgresql'):
+        table = kind.model.__table__
+        name = db.session.get_bind().dialect.identifier_preparer.format_table(table)
+        sequence = func.pg_get_serial_sequence(name, 'id')
+        db.session.execute(select(func.setval(sequence, func.greatest(
+            select(func.max(table.c.id)).scalar_subquery(),
+            func.pg_sequence_last_value(cast(sequence, REGCLASS))))))
+    return inserted, ids
+
+def _after_insert(kind, batch, ids):
+    # Everything a single insert would also have written; returns the cache
+    # tags to drop.
+    model = kind.model
+
+    if model is Question:
+        names = sorted({name for _, values in batch for name in values['tags']})
+        tags = Tag.get_or_create(names)
+        links = [{'question_id': id, 'tag_id': tags[name].id, 'position': position}
+                 for id, (_, values) in zip(ids, batch)
+                 for position, name in enumerate(values['tags'])]
+        if links:
+            db.session.execute(insert(QuestionTag), links)
+
+    if model is Answer:
+        counts = Counter(values['question_id'] for _, values in batch)
+        table = Question.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('question'))
+            .values(answer_count=table.c.answer_count + bindparam('added')),
+            [{'question': id, 'added': added} for id, added in counts.items()])
+        return ['questions'] + [tag for id in counts for tag in (f'question:{id}', f'answers:{id}')]
+
+    index = INDEXES.get(model)
+    if index is not None and index.loaded:
+        for id, (_, values) in zip(ids, batch):
+            index.add(id, [values[name] for name, _ in index.fields])
+
+    return {Question: ['questions'], Article: ['articles']}.get(model, [])
+
+def _write(kind, batch, report):
+    batch = _check(kind, batch, report)
+    if not batch:
+        return
+
+    if kind.model is User:
+        plain = [(values, values.pop('plain_password')) for _, values in batch if 'plain_password' in values]
+        hashes = hasher.hash_passwords([password for _, password in plain]) if plain else []
+        for (values, _), hashed in zip(plain, hashes):
+            values['password'] = hashed
+
+    batch, ids = _insert(kind, batch, report)
+    tags = _after_insert(kind, batch, ids) if batch else []
+    commit(*tags)
+    report.inserted += len(ids)
+
+"""
+import_ndjson(name, lines, user_id=None, batch_size=BULK_BATCH_SIZE)
+    imports an iterable of NDJSON lines (str or bytes) into the collection
+    `name`. Rows without a user_id are attributed to `user_id`.
+"""
+def import_ndjson(name, lines, user_id=None, batch_size=BULK_BATCH_SIZE):
+    kind = KINDS[name]
+    report = ImportReport()
+    batch = []
+
+    for line, raw in enumerate(lines, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+            if not isinstance(row, dict):
+                raise RowError('row must be a JSON object')
+            batch.append((line, kind.validate(row, user_id)))
+        except ValueError:
+            report.error(line, 'invalid JSON')
+        except RowError as error:
+            report.error(line, str(error))
+
+        if len(batch) >= batch_size:
+            _write(kind, batch, report)
+            batch = []
+
+    if batch:
+        _write(kind, batch, report)
+    return report.format()
+
+"""
+export_ndjson(name, batch_size=BULK_BATCH_SIZE)
+    yields the collection `name` as NDJSON, one chunk per batch of rows read
+    through a server-side cursor.
+"""
+def export_ndjson(name, batch_size=BULK_BATCH_SIZE):
+    kind = KINDS[name]
+    query = kind.export().order_by(kind.model.id).yield_per(batch_size)
+
+    chunk = []
+    for row in query:
+        chunk.append(json.dumps(kind.dump(row)))
+        if len(chunk) >= batch_size:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+bulk_cli = AppGroup('bulk', help='Bulk NDJSON import and export.')
+
+@bulk_cli.command('import')
+@click.argument('name', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('rb'), default='-')
+@click.option('--user-id', type=int, default=None, help='Author of rows without a user_id.')
+@click.option('--batch-size', type=int, default=BULK_BATCH_SIZE, show_default=True)
+def import_command(name, source, user_id, batch_size):
+    """Import NDJSON rows from SOURCE (default: stdin)."""
+    report = import_ndjson(name, source, user_id, batch_size)
+    click.echo(json.dumps(report, indent=2))
+    if report['failed']:
+        raise SystemExit(1)
+
+@bulk_cli.command('export')
+@click.argument('name', type=click.Choice(sorted(KINDS)))
+@click.argument('target', type=click.File('w'), default='-')
+@click.option('--batch-size', type=int, default=BULK_BATCH_SIZE, show_default=True)
+def export_command(name, target, batch_size):
+    """Export rows as NDJSON to TARGET (default: stdout)."""
+    for chunk in export_ndjson(name, batch_size):
+        target.write(chunk)
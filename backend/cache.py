@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import socket
+import threading
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode, urlparse
+from flask import g, request, current_app
+
+from database.routing import REPLICA_STICKY_SECONDS
+
+"""
+Response cache for the anonymous read endpoints.
+
+Entries are keyed by path + query string and labelled with tags such as
+'questions' or 'question:3'. Model writes invalidate the tags they affect
+(see `cache_tags()` in database/models.py) after they commit, so entries never
+outlive the rows they were rendered from; the TTL only bounds memory.
+
+Invalidating a tag also bumps its generation, and every key carries the
+generations of its tags as read before the view ran. A response rendered
+while a write commits is thus stored under a key no later request looks up.
+
+CACHE_URL picks the backend: unset for the in-process LRU, `redis://host:port/db`
+for anything speaking the Redis protocol, `none` to disable caching. The LRU
+is per process, so server.py disables it when it runs several workers.
+CACHE_TTL is in seconds; CACHE_SIZE bounds the LRU's entries.
+"""
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 60))
+CACHE_SIZE = int(os.environ.get('CACHE_SIZE', 1024))
+
+
+def _generation_key(key, generations):
+    return key + '#' + '.'.join(str(generation) for generation in generations)
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key: (expires, value, tags)
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.generations = {}
+        # Bumped by clear(), which forgets the generations.
+        self.epoch = 0
+        self.lock = threading.Lock()
+
+    def generation_key(self, key, tags):
+        with self.lock:
+            return _generation_key(key, [self.epoch, *(self.generations.get(tag, 0) for tag in tags)])
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value, _ = entry
+            if expires <= time.monotonic():
+                self._drop(key)
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags):
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+
+            while len(self.entries) > self.maxsize:
+                self._drop(next(iter(self.entries)))
+
+    def _drop(self, key):
+        # Removes an entry and its key from the sets of its tags.
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] = self.generations.get(tag, 0) + 1
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+
+            # One generation per row ever written: start over once they
+            # outnumber the entries by far.
+            if len(self.generations) > 8 * self.maxsize:
+                self._clear()
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.entries.clear()
+        self.tags.clear()
+        self.generations.clear()
+        self.epoch += 1
+
+"""
+RedisCache
+    the same interface over the Redis protocol (RESP), so Redis or any local
+    stand-in speaking it can share entries between worker processes. Each
+    tag's generation is a counter key, and `gen:*` one for clear(); entries
+    of older generations are left to expire. A failing server is treated as
+    a cache miss; requests never fail because of the cache.
+"""
+class RedisCache:
+
+    def __init__(self, url, ttl=CACHE_TTL, prefix='stc:', timeout=0.5):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or 'localhost', parsed.port or 6379)
+        self.db = int(parsed.path.strip('/') or 0)
+        self.password = parsed.password
+        self.ttl = ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            sock = socket.create_connection(self.address, self.timeout)
+            connection = self.local.connection = (sock, sock.makefile('rb'))
+            if self.password:
+                self._command('AUTH', self.password)
+            if self.db:
+                self._command('SELECT', self.db)
+        return connection
+
+    def _disconnect(self):
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection is not None:
+            connection[0].close()
+
+    def _command(self, *args):
+        sock, reader = self._connection()
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        sock.sendall(b''.join(parts))
+        return self._reply(reader)
+
+    def _reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('connection closed')
+
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise ConnectionError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._reply(reader) for _ in range(length)]
+        raise ConnectionError(f'unexpected reply {line!r}')
+
+    def _safe(self, *args):
+        try:
+            return self._command(*args)
+        except (OSError, ConnectionError, ValueError):
+            self._disconnect()
+            return None
+
+    def generation_key(self, key, tags):
+        names = [self.prefix + 'gen:' + tag for tag in ('*', *tags)]
+        generations = self._safe('MGET', *names)
+        if generations is None:
+            return None
+        return _generation_key(key, [int(generation or 0) for generation in generations])
+
+    def get(self, key):
+        value = self._safe('GET', self.prefix + key)
+        return None if value is None else tuple(json.loads(value))
+
+    def set(self, key, value, tags):
+        status, mimetype, body, etag = value
+        payload = json.dumps([status, mimetype, body.decode(), etag])
+        self._safe('SET', self.prefix + key, payload, 'EX', self.ttl)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._safe('INCR', self.prefix + 'gen:' + tag)
+
+    def clear(self):
+        self._safe('INCR', self.prefix + 'gen:*')
+
+
+class NullCache:
+
+    def generation_key(self, key, tags):
+        return None
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tags):
+        pass
+
+    def invalidate(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+def create_cache(url=CACHE_URL):
+    if url.startswith('redis://'):
+        return RedisCache(url)
+    if url == 'none':
+        return NullCache()
+    return LRUCache()
+
+response_cache = create_cache()
+
+"""
+share_cache(workers)
+    keeps the response cache coherent across `workers` processes. The
+    in-process LRU is only invalidated in the process that wrote, so with more
+    than one worker it is disabled unless CACHE_URL names a shared backend.
+"""
+def share_cache(workers):
+    global response_cache
+    if workers > 1 and isinstance(response_cache, LRUCache):
+        response_cache = NullCache()
+    return response_cache
+
+# When this process last dropped entries; see `cached()`.
+last_invalidation = 0.0
+
+def invalidate(*tags):
+    global last_invalidation
+    last_invalidation = time.monotonic()
+    response_cache.invalidate(*tags)
+
+def invalidate_all():
+    global last_invalidation
+    last_invalidation = time.monotonic()
+    response_cache.clear()
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+# The query arguments the cached views read; others are left out of the key.
+CACHE_ARGS = ('sort', 'after', 'page')
+
+"""
+cached(*tags)
+    caches successful responses of an anonymous GET view. Tags are format
+    strings filled from the view's arguments, e.g. cached('question:{id}').
+    Only the CACHE_ARGS of the query string are part of the key.
+    A hit whose ETag the client already holds is answered with 304.
+    Responses read from a replica shortly after an invalidation are not
+    stored, as the replica may not have the write yet.
+"""
+def cached(*tags):
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            labels = [tag.format(**kwargs) for tag in tags]
+            key = response_cache.generation_key(request.path + '?' + urlencode(sorted(
+                (name, value) for name, value in request.args.items(multi=True) if name in CACHE_ARGS)),
+                labels)
+
+            hit = response_cache.get(key) if key is not None else None
+            if hit is not None:
+                status, mimetype, body, etag = hit
+                if etag is not None and request.if_none_match.contains(etag):
+                    response = not_modified(etag)
+                else:
+                    response = current_app.response_class(body, status=status, mimetype=mimetype)
+                    if etag is not None:
+                        response.set_etag(etag)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            lagging = (g.get('replica') is not None
+                       and time.monotonic() - last_invalidation < REPLICA_STICKY_SECONDS)
+            if key is not None and response.status_code == 200 and not lagging:
+                etag, _ = response.get_etag()
+                response_cache.set(key, (200, response.mimetype, response.get_data(), etag), labels)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return cached_decorator
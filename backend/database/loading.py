@@ -0,0 +1,42 @@
+from sqlalchemy.orm import joinedload, selectinload, raiseload
+
+from .models import Question, QuestionTag, Answer, Article
+
+"""
+Load plans
+    the relationships each endpoint serializes, loaded up front so that
+    `short_format()`, `long_format()` and `format()` only read data that is
+    already in the identity map. Anything outside the plan raises instead of
+    silently issuing one SELECT per row.
+"""
+QUESTION_LIST = (
+    joinedload(Question.user),
+    selectinload(Question.question_tags).joinedload(QuestionTag.tag),
+)
+
+QUESTION_DETAIL = (
+    joinedload(Question.user),
+    selectinload(Question.question_tags).joinedload(QuestionTag.tag),
+    selectinload(Question.answers).joinedload(Answer.user),
+)
+
+QUESTION_EXPORT = (
+    selectinload(Question.question_tags).joinedload(QuestionTag.tag),
+)
+
+ANSWER_LIST = (
+    joinedload(Answer.user),
+)
+
+ARTICLE_LIST = (
+    joinedload(Article.user),
+)
+
+ARTICLE_DETAIL = ARTICLE_LIST
+
+"""
+load(query, plan)
+    applies a load plan to a query and forbids any other lazy load.
+"""
+def load(query, plan):
+    return query.options(*plan, raiseload('*'))
@@ -1,30 +1,60 @@
-import bcrypt
-import json
-from datetime import datetime
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, select, update, event, DDL, func
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
 from flask_sqlalchemy import SQLAlchemy
+from hashing import hasher
+from cache import invalidate, invalidate_all
+from database.config import DatabaseConfig
+from database.pool import instrument
+from database.routing import RoutingSession, remember_writes
 
-date = datetime.now()
-db_string = date.strftime("%B %d, %Y | %H:%M:%S")
+# How timestamps are rendered in API responses.
+STAMP_FORMAT = "%B %d, %Y | %H:%M:%S"
 
-host = 'localhost:5432'
-database_name = 'stc'
-database_path = f'postgresql://postgres:August404@{host}/{database_name}'
+def stamp(value):
+    return value.strftime(STAMP_FORMAT) if value is not None else None
 
-db = SQLAlchemy()
+# SQLite fills server defaults from CURRENT_TIMESTAMP, which has no fractional
+# seconds; bound values are stored the same way so that keyset comparisons
+# between the two line up.
+Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(
+    storage_format='%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d'), 'sqlite')
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+"""
+commit(*tags)
+    commits the session, then drops the cached responses labelled with `tags`.
+"""
+def commit(*tags):
+    db.session.commit()
+    invalidate(*tags)
 
 """
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+setup_db(app, config=None, create_schema=True)
+    binds a flask application and a SQLAlchemy service. `config` is a
+    DatabaseConfig (or a bare URI); by default it is read from the environment.
+    With `create_schema`, missing tables are created.
 """
-def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, config=None, create_schema=True):
+    if config is None or isinstance(config, str):
+        config = DatabaseConfig(uri=config)
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = config.uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = config.engine_options()
+    app.config["SQLALCHEMY_BINDS"] = config.binds()
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
 
+    app.after_request(remember_writes)
+
     with app.app_context():
-        db.create_all()
+        for engine in db.engines.values():
+            config.configure(engine)
+            instrument(engine)
+        if create_schema:
+            db.create_all()
 
 class Group(db.Model):
     __tablename__ = 'group'
@@ -63,6 +93,8 @@ class User(db.Model):
     is_superuser = Column(Boolean(create_constraint=False))
     is_staff = Column(Boolean(create_constraint=False))
     is_active = Column(Boolean(create_constraint=True))
+    # Bumped on every change to the row; part of the ETag of what they wrote.
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
 
     # Managing RBAC(Role Based Access Control)
     group = db.relationship('Group', backref=db.backref('users',lazy=True))
@@ -70,7 +102,7 @@ class User(db.Model):
 
     def __init__(self, username, password, role, is_superuser=False, is_staff=False, is_active=True, first_name=None, last_name=None):
         self.username = username
-        self.password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        self.password = hasher.hash_password(password)
         self.first_name = first_name
         self.last_name = last_name
         self.role = role
@@ -83,15 +115,64 @@ class User(db.Model):
         db.session.commit()
 
     def update(self):
+        # Names and roles are rendered next to every question, answer and
+        # article, so any cached response may be stale.
+        self.version = type(self).version + 1
         db.session.commit()
+        invalidate_all()
 
     def delete(self):
+        # The cascades below delete the user's votes and answers without
+        # count_vote() or Answer.delete().
+        self.uncount_votes()
+        self.uncount_answers()
         db.session.delete(self)
         db.session.commit()
+        invalidate_all()
+
+    def uncount_votes(self):
+        # Takes the user's votes off the tallies of the answers they voted
+        # on, in the caller's transaction. A user has one vote per answer.
+        def ballots(column):
+            return (select(func.count(Vote.id))
+                .where(Vote.answer_id == Answer.id, Vote.user_id == self.id, column.is_(True))
+                .scalar_subquery())
+
+        db.session.execute(
+            update(Answer)
+            .where(Answer.id.in_(select(Vote.answer_id).where(Vote.user_id == self.id)))
+            .values(
+                upvote_count=Answer.upvote_count - ballots(Vote.upvote),
+                downvote_count=Answer.downvote_count - ballots(Vote.downvote),
+                version=Answer.version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def uncount_answers(self):
+        # Takes the user's answers off the answer_count of their questions.
+        answers = (select(func.count(Answer.id))
+            .where(Answer.question_id == Question.id, Answer.user_id == self.id)
+            .scalar_subquery())
+
+        db.session.execute(
+            update(Question)
+            .where(Question.id.in_(select(Answer.question_id).where(Answer.user_id == self.id)))
+            .values(answer_count=Question.answer_count - answers)
+            .execution_options(synchronize_session=False)
+        )
 
     def is_authenticated(self,password):
         #Checks if user's information corresponds
-        state = bcrypt.checkpw(password.encode(), self.password.encode())
+        state = hasher.check_password(password, self.password)
+
+        # Upgrade hashes made with a different cost factor while the
+        # plain password is at hand. No cached response renders the hash,
+        # so this commits without update() and its cache invalidation.
+        if state and hasher.needs_rehash(self.password):
+            self.password = hasher.hash_password(password)
+            db.session.commit()
+
         return state
 
     def short(self):
@@ -117,41 +198,79 @@ class User(db.Model):
 
 class Question(db.Model):
     __tablename__ = 'question'
+    __table_args__ = (
+        # Keyset pagination keys for the listing sorts.
+        db.Index('ix_question_created_at_id', 'created_at', 'id'),
+        db.Index('ix_question_answer_count_id', 'answer_count', 'id'),
+        # A user's questions, newest last; also the lookup for cascades from user.
+        db.Index('ix_question_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
     # Autoincrementing, unique primary key
     id = Column(Integer().with_variant(Integer, "postgresql"), primary_key=True)
     title = Column(String(80), nullable=False, unique=True)
     body = Column(String(), unique=True, nullable=False)
-    tag = Column(String(150), nullable=True)
-    created_on = Column(String(80))
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(Timestamp, nullable=False, server_default=func.now(), onupdate=func.now())
+    # Bumped on every change to the row; the basis of its ETag.
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
+    # Denormalized number of answers, kept in step by Answer.insert()/delete().
+    answer_count = Column(Integer(), nullable=False, default=0, server_default='0')
     user = db.relationship('User', backref=db.backref('questions',lazy=True, cascade='all,delete'))
     user_id = Column(Integer(), ForeignKey('user.id'))
 
-    def __init__(self, title, body, tag, user_id):
+    question_tags = db.relationship('QuestionTag', order_by='QuestionTag.position',
+                                    cascade='all,delete-orphan', lazy=True)
+
+    def __init__(self, title, body, tags, user_id):
         self.title = title
         self.body = body
-        self.tag = tag
-        self.created_on = db_string
+        self.set_tags(tags)
         self.user_id = user_id
 
+    @property
+    def tags(self):
+        return [question_tag.tag.name for question_tag in self.question_tags]
+
+    def set_tags(self, names):
+        # Keeps the given order; rows for tags the question already has are
+        # reused so only the difference is written.
+        names = list(dict.fromkeys(Tag.normalize(name) for name in names))
+        tags = Tag.get_or_create(names)
+        current = {question_tag.tag_id: question_tag for question_tag in self.question_tags}
+
+        question_tags = []
+        for position, name in enumerate(names):
+            question_tag = current.get(tags[name].id) or QuestionTag(tag=tags[name])
+            question_tag.position = position
+            question_tags.append(question_tag)
+        self.question_tags = question_tags
+
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        commit(*self.cache_tags())
 
     def update(self):
-        db.session.commit()
+        self.version = type(self).version + 1
+        commit(*self.cache_tags())
 
     def delete(self):
+        tags = self.cache_tags()
         db.session.delete(self)
-        db.session.commit()
+        commit(*tags)
+
+    def cache_tags(self):
+        # Cached responses that render this row.
+        return ['questions', f'question:{self.id}', f'answers:{self.id}']
 
     def short_format(self):
         return {
             'id': self.id,
             'title': self.title,
             'body': self.body,
-            'tags': json.loads(self.tag),
-            'created_on': self.created_on,
+            'tags': self.tags,
+            'created_on': stamp(self.created_at),
             'user': self.user.username,
             'user_id': self.user_id,
             'role': self.user.role
@@ -162,21 +281,94 @@ class Question(db.Model):
             'id': self.id,
             'title': self.title,
             'body': self.body,
-            'tags': json.loads(self.tag),
-            'created_on': self.created_on,
+            'tags': self.tags,
+            'created_on': stamp(self.created_at),
             'answers': [answer.format() for answer in self.answers],
             'user': self.user.username,
             'user_id': self.user_id,
             'role': self.user.role
         }
 
+class Tag(db.Model):
+    __tablename__ = 'tag'
+
+    # Autoincrementing, unique primary key
+    id = Column(Integer().with_variant(Integer, "postgresql"), primary_key=True)
+    name = Column(String(80), nullable=False, unique=True)
+
+    def __init__(self, name):
+        self.name = name
+
+    @staticmethod
+    def normalize(name):
+        return str(name).strip().lower()
+
+    @classmethod
+    def get_or_create(cls, names):
+        # Returns {name: Tag} for the given normalized names. Missing tags are
+        # inserted so that a concurrent writer creating the same one wins
+        # quietly, then every name is read back.
+        if not names:
+            return {}
+        tags = {tag.name: tag for tag in cls.query.filter(cls.name.in_(names))}
+        missing = [name for name in names if name not in tags]
+        if not missing:
+            return tags
+
+        db.session.flush()
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(
+                postgresql.insert(cls).values([{'name': name} for name in missing])
+                .on_conflict_do_nothing(index_elements=['name']))
+        else:
+            for name in missing:
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(cls(name))
+                except IntegrityError:
+                    pass
+        return {tag.name: tag for tag in cls.query.filter(cls.name.in_(names))}
+
+    def format(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+        }
+
+class QuestionTag(db.Model):
+    __tablename__ = 'question_tag'
+    __table_args__ = (
+        # Serves "questions with tag X" as a range scan, newest ids last.
+        db.Index('ix_question_tag_tag_id_question_id', 'tag_id', 'question_id'),
+    )
+
+    question_id = Column(Integer(), ForeignKey('question.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = Column(Integer(), ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+    # Order of the tag as the author listed it.
+    position = Column(Integer(), nullable=False, default=0)
+
+    tag = db.relationship('Tag')
+
 class Answer(db.Model):
     __tablename__ = 'answer'
+    __table_args__ = (
+        db.Index('ix_answer_question_id_created_at_id', 'question_id', 'created_at', 'id'),
+        db.Index('ix_answer_question_id_upvote_count_id', 'question_id', 'upvote_count', 'id'),
+        db.Index('ix_answer_user_id', 'user_id'),
+    )
 
     # Autoincrementing, unique primary key
     id = Column(Integer().with_variant(Integer, "postgresql"), primary_key=True)
     body = Column(String(), nullable=False)
-    created_on = Column(String(80))
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(Timestamp, nullable=False, server_default=func.now(), onupdate=func.now())
+    # Bumped on every change to the row, tallies included; the basis of its ETag.
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
+
+    # Denormalized tallies of the votes on this answer, kept in step with the
+    # vote table by count_vote().
+    upvote_count = Column(Integer(), nullable=False, default=0, server_default='0')
+    downvote_count = Column(Integer(), nullable=False, default=0, server_default='0')
 
     question = db.relationship('Question', backref=db.backref('answers',lazy=True, cascade='all,delete'))
     question_id = Column(Integer(), ForeignKey('question.id'))
@@ -186,45 +378,74 @@ class Answer(db.Model):
 
     def __init__(self, body, question_id, user_id):
         self.body = body
-        self.created_on = db_string
         self.question_id = question_id
         self.user_id = user_id
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        self.count_answer(1)
+        commit(*self.cache_tags())
 
     def update(self):
-        db.session.commit()
+        self.version = type(self).version + 1
+        commit(*self.cache_tags())
 
     def delete(self):
+        tags = self.cache_tags()
         db.session.delete(self)
-        db.session.commit()
+        self.count_answer(-1)
+        commit(*tags)
+
+    def count_answer(self, step):
+        # Keeps question.answer_count in the same transaction as the answer.
+        db.session.execute(
+            update(Question)
+            .where(Question.id == self.question_id)
+            .values(answer_count=Question.answer_count + step)
+        )
+
+    def cache_tags(self):
+        # Cached responses that render this row; listings sort by answer count.
+        return ['questions', f'question:{self.question_id}', f'answers:{self.question_id}']
+
+    @classmethod
+    def count_vote(cls, answer_id, upvotes=0, downvotes=0):
+        # Atomically shifts the tallies in the caller's transaction and
+        # returns the new (upvotes, downvotes).
+        statement = (
+            update(cls)
+            .where(cls.id == answer_id)
+            .values(
+                upvote_count=cls.upvote_count + upvotes,
+                downvote_count=cls.downvote_count + downvotes,
+                version=cls.version + 1,
+            )
+            .returning(cls.upvote_count, cls.downvote_count)
+        )
+        return tuple(db.session.execute(statement).one())
 
     def format(self):
-        # Return the upvotes and downvotes on an answer.
-        upvotes, downvotes = (0, 0)
-
-        for vote in self.votes:
-            if vote.upvote:
-                upvotes += 1
-            else:
-                downvotes += 1
-
         return {
             'id': self.id,
             'body': self.body,
-            'created_on': self.created_on,
+            'created_on': stamp(self.created_at),
             'question_id': self.question_id,
             'user': self.user.username,
             'user_id': self.user_id,
             'role': self.user.role,
-            'upvotes': upvotes,
-            'downvotes': downvotes
+            'upvotes': self.upvote_count,
+            'downvotes': self.downvote_count
         }
     
 class Vote(db.Model):
     __tablename__ = 'vote'
+    __table_args__ = (
+        # One vote per user per answer; also the conflict target of cast_vote().
+        db.Index('ix_vote_user_id_answer_id', 'user_id', 'answer_id', unique=True),
+        # Votes of an answer, for tallies and deletes; includes the ballot columns.
+        db.Index('ix_vote_answer_id_upvote_downvote', 'answer_id', 'upvote', 'downvote'),
+    )
 
     # Autoincrementing, unique primary key
     id = Column(Integer().with_variant(Integer, "postgresql"), primary_key=True)
@@ -267,13 +488,20 @@ class Vote(db.Model):
     
 class Article(db.Model):
     __tablename__ = 'article'
+    __table_args__ = (
+        db.Index('ix_article_created_at_id', 'created_at', 'id'),
+        db.Index('ix_article_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_article_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
     # Autoincrementing, unique primary key
     id = Column(Integer().with_variant(Integer, "postgresql"), primary_key=True)
     title = Column(String(80), nullable=False, unique=True)
     body = Column(String(), unique=True, nullable=False)
-    created_on = Column(String(80))
-    updated_on = Column(String(80))
+    created_at = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(Timestamp, nullable=False, server_default=func.now(), onupdate=func.now())
+    # Bumped on every change to the row; the basis of its ETag.
+    version = Column(Integer(), nullable=False, default=1, server_default='1')
 
     user = db.relationship('User', backref=db.backref('articles',lazy=True, cascade='all,delete'))
     user_id = Column(Integer(), ForeignKey('user.id'))
@@ -281,31 +509,73 @@ class Article(db.Model):
     def __init__(self, title, body, user_id):
         self.title = title
         self.body = body
-        self.created_on = db_string
-        self.updated_on = db_string
         self.user_id = user_id
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        commit(*self.cache_tags())
 
     def update(self):
-        db.session.commit()
+        self.version = type(self).version + 1
+        commit(*self.cache_tags())
 
     def delete(self):
+        tags = self.cache_tags()
         db.session.delete(self)
-        db.session.commit()
+        commit(*tags)
+
+    def cache_tags(self):
+        # Cached responses that render this row.
+        return ['articles', f'article:{self.id}']
 
     def short_format(self):
         return {
             'id': self.id,
             'title': self.title,
             'body': self.body,
-            'created_on': self.created_on,
-            'updated_on': self.updated_on,
+            'created_on': stamp(self.created_at),
+            'updated_on': stamp(self.updated_at),
             'first_name': self.user.first_name,
             'last_name': self.user.last_name,
             'user': self.user.username,
             'user_id': self.user_id,
             'role': self.user.role
-        }
\ No newline at end of file
+        }
+
+    def format(self):
+        return self.short_format()
+
+"""
+Full-text search
+    PostgreSQL keeps a weighted tsvector per row in a generated column with a
+    GIN index (see search.py). The columns are not mapped, so other databases
+    build the same schema without them.
+"""
+QUESTION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+ARTICLE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+for table, vector in ((Question.__table__, QUESTION_SEARCH_VECTOR), (Article.__table__, ARTICLE_SEARCH_VECTOR)):
+    event.listen(table, 'after_create', DDL(
+        f'ALTER TABLE {table.name} ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({vector}) STORED'
+    ).execute_if(dialect='postgresql'))
+    event.listen(table, 'after_create', DDL(
+        f'CREATE INDEX ix_{table.name}_search_vector ON {table.name} USING gin (search_vector)'
+    ).execute_if(dialect='postgresql'))
+
+# Author-name search is a case-insensitive prefix match on the username; see
+# search.author_match() for the form each index serves.
+event.listen(User.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_user_username_lower ON "user" (lower(username) text_pattern_ops)'
+).execute_if(dialect='postgresql'))
+event.listen(User.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_user_username_lower ON "user" (lower(username))'
+).execute_if(dialect='sqlite'))
@@ -0,0 +1,123 @@
+import time
+import threading
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+"""
+PoolMetrics
+    checkout, wait and health counters of one connection pool.
+
+    `waits` counts checkouts that found every connection busy and had to block
+    for one to be returned; `timeouts` those that gave up after pool_timeout.
+    `invalidations` counts connections discarded as dead, e.g. by pre-ping
+    after a failover.
+"""
+class PoolMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.waits += 1
+            self.timeouts += timed_out
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_seconds * 1000, 3),
+                'wait_ms_max': round(self.max_wait_seconds * 1000, 3),
+            }
+
+"""
+InstrumentedQueuePool
+    a QueuePool that times checkouts which have to wait for a connection.
+    The metrics outlive `dispose()`, which recreates the pool.
+"""
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        # Every connection is checked out and no overflow is left.
+        exhausted = self._pool.empty() and 0 <= self._max_overflow <= self._overflow
+        if not exhausted:
+            return super()._do_get()
+
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+"""
+instrument(engine)
+    counts connects, checkouts, checkins and invalidations of the engine's
+    pool, whatever its class.
+"""
+def instrument(engine):
+    metrics = getattr(engine.pool, 'metrics', None)
+    if metrics is None:
+        metrics = engine.pool.metrics = PoolMetrics()
+
+    # Looked up on every event: dispose() swaps in a new pool object.
+    def counter(name):
+        return lambda *args: getattr(engine.pool, 'metrics', metrics).count(name)
+
+    event.listen(engine, 'connect', counter('connects'))
+    event.listen(engine, 'checkout', counter('checkouts'))
+    event.listen(engine, 'checkin', counter('checkins'))
+    event.listen(engine, 'invalidate', counter('invalidations'))
+    return metrics
+
+"""
+pool_status(engine)
+    the pool's sizing and current occupancy next to its counters.
+"""
+def pool_status(engine):
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'timeout': pool.timeout(),
+        })
+
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
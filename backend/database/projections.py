@@ -0,0 +1,69 @@
+from sqlalchemy import func, select
+
+from .models import db, User, Question, QuestionTag, Tag, Article
+
+"""
+Projections
+    the columns a listing shows, selected as plain rows instead of loading
+    entities. Bodies are cut to an excerpt by the database, so a long post
+    costs the same as a short one until its detail route is opened.
+
+    `question_summaries()` and `article_summaries()` are queries of db.session;
+    the `*_select()` forms are the same statements for any other session.
+"""
+EXCERPT_LENGTH = 200
+
+def excerpt(column):
+    # One character more than is shown, to tell whether the body was cut.
+    return func.substr(column, 1, EXCERPT_LENGTH + 1).label('excerpt')
+
+QUESTION_SUMMARY = (
+    Question.id, Question.title, excerpt(Question.body), Question.created_at,
+    Question.answer_count, Question.user_id, User.username, User.role,
+)
+
+ARTICLE_SUMMARY = (
+    Article.id, Article.title, excerpt(Article.body), Article.created_at,
+    Article.updated_at, Article.user_id, User.username, User.first_name,
+    User.last_name, User.role,
+)
+
+def question_summaries():
+    return db.session.query(*QUESTION_SUMMARY).outerjoin(User, Question.user_id == User.id)
+
+def article_summaries():
+    return db.session.query(*ARTICLE_SUMMARY).outerjoin(User, Article.user_id == User.id)
+
+def authored_article_summaries(author_filter):
+    # An inner join, so that the planner may start from the matching authors.
+    return (db.session.query(*ARTICLE_SUMMARY)
+        .join(User, Article.user_id == User.id)
+        .filter(author_filter))
+
+def question_summaries_select():
+    return select(*QUESTION_SUMMARY).outerjoin(User, Question.user_id == User.id)
+
+def article_summaries_select():
+    return select(*ARTICLE_SUMMARY).outerjoin(User, Article.user_id == User.id)
+
+"""
+question_tags(ids)
+    {question id: [tag names in order]} for a page of questions, in one query.
+    `tags_select(ids)` and `group_tags(ids, rows)` are its two halves.
+"""
+def question_tags(ids):
+    if not ids:
+        return {}
+    return group_tags(ids, db.session.execute(tags_select(ids)))
+
+def tags_select(ids):
+    return (select(QuestionTag.question_id, Tag.name)
+        .join(Tag, QuestionTag.tag_id == Tag.id)
+        .where(QuestionTag.question_id.in_(ids))
+        .order_by(QuestionTag.question_id, QuestionTag.position))
+
+def group_tags(ids, rows):
+    tags = {id: [] for id in ids}
+    for question_id, name in rows:
+        tags[question_id].append(name)
+    return tags
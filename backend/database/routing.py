@@ -0,0 +1,111 @@
+import os
+import time
+import itertools
+import threading
+from functools import wraps
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select, CompoundSelect
+
+"""
+Read-replica routing.
+
+Views marked with @read_only send their SELECTs to a replica bind (any bind
+key starting with 'replica', see DatabaseConfig.replicas). Everything else,
+and anything a read-only view writes, goes to the primary.
+
+A client that has just written is pinned to the primary for
+REPLICA_STICKY_SECONDS through a cookie, so it reads its own writes while the
+replicas catch up.
+"""
+REPLICA_PREFIX = 'replica'
+REPLICA_STRATEGY = os.environ.get('DB_REPLICA_STRATEGY', 'round_robin')
+REPLICA_STICKY_SECONDS = float(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+STICKY_COOKIE = 'stc_primary_until'
+
+
+class ReplicaBalancer:
+
+    def __init__(self, strategy=REPLICA_STRATEGY):
+        if strategy not in ('round_robin', 'least_connections'):
+            raise ValueError(f'unknown replica strategy {strategy!r}')
+        self.strategy = strategy
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def choose(self, replicas):
+        if self.strategy == 'least_connections':
+            return min(replicas, key=lambda engine: (
+                engine.pool.checkedout() if isinstance(engine.pool, QueuePool) else 0))
+
+        with self.lock:
+            return replicas[next(self.counter) % len(replicas)]
+
+balancer = ReplicaBalancer()
+
+def _replicas(engines):
+    return [engine for key, engine in sorted(engines.items(), key=lambda item: str(item[0]))
+            if isinstance(key, str) and key.startswith(REPLICA_PREFIX)]
+
+def pinned_to_primary(cookies):
+    try:
+        return float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def _pinned_to_primary():
+    return pinned_to_primary(request.cookies)
+
+"""
+RoutingSession
+    db.session's class. Reads of a @read_only view use one replica for the
+    whole request; flushes and non-SELECT statements always use the primary
+    and mark the request as having written.
+"""
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        reading = not self._flushing and isinstance(clause, (Select, CompoundSelect))
+        if not has_request_context():
+            return super().get_bind(mapper, clause, bind, **kwargs)
+
+        if not reading:
+            # A bare get_bind() only asks which database is in use.
+            if self._flushing or clause is not None:
+                g.wrote_primary = True
+        elif g.get('read_only', False) and not _pinned_to_primary():
+            replica = g.get('replica')
+            if replica is None:
+                replicas = _replicas(self._db.engines)
+                if replicas:
+                    replica = g.replica = balancer.choose(replicas)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+"""
+read_only
+    marks a view whose reads may be served by a replica.
+"""
+def read_only(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return f(*args, **kwargs)
+    return wrapper
+
+"""
+remember_writes(response)
+    after_request hook pinning a client that wrote to the primary.
+"""
+def remember_writes(response):
+    if g.get('wrote_primary', False) and response.status_code < 400:
+        response.set_cookie(
+            STICKY_COOKIE, str(time.time() + REPLICA_STICKY_SECONDS),
+            max_age=int(REPLICA_STICKY_SECONDS) + 1, httponly=True, samesite='Lax')
+    return response
@@ -0,0 +1,98 @@
+import random
+from sqlalchemy import insert
+
+from hashing import hasher
+from database.models import db, User, Question, Tag, QuestionTag, Answer, Vote, Article
+
+"""
+Seeds a database with generated users, questions, answers, votes and articles.
+
+Rows are written with executemany inserts, so a few hundred thousand rows take
+seconds rather than minutes. Denormalized columns (answer_count, vote tallies)
+are filled in consistently with the rows generated. Every user shares one
+password hash, computed once.
+
+    with app.app_context():
+        seed(users=1000, questions=20000)
+"""
+def seed(users=200, questions=2000, answers_per_question=5, votes_per_answer=3,
+         articles=1000, tags=50, password='password', random_seed=0):
+    generator = random.Random(random_seed)
+    hashed = hasher.hash_password(password)
+
+    db.session.execute(insert(User), [{
+        'username': f'member{i}',
+        'password': hashed,
+        'first_name': f'First{i}',
+        'last_name': f'Last{i}',
+        'role': ('student', 'staff', 'manager')[i % 3],
+        'is_superuser': False,
+        'is_staff': i % 3 != 0,
+        'is_active': True,
+    } for i in range(users)])
+    user_ids = list(db.session.scalars(db.select(User.id).order_by(User.id)))
+
+    if tags:
+        db.session.execute(insert(Tag), [{'name': f'tag{i}'} for i in range(tags)])
+    tag_ids = list(db.session.scalars(db.select(Tag.id).order_by(Tag.id)))
+
+    answer_counts = [generator.randint(0, 2 * answers_per_question) for _ in range(questions)]
+    if questions:
+        db.session.execute(insert(Question), [{
+            'title': f'Question {i}',
+            'body': f'Body of question {i}',
+            'answer_count': answer_counts[i],
+            'user_id': generator.choice(user_ids),
+        } for i in range(questions)])
+    question_ids = list(db.session.scalars(db.select(Question.id).order_by(Question.id)))
+
+    links = []
+    for question_id in question_ids:
+        chosen = generator.sample(tag_ids, min(3, len(tag_ids)))
+        links.extend({'question_id': question_id, 'tag_id': tag_id, 'position': position}
+                     for position, tag_id in enumerate(chosen))
+    if links:
+        db.session.execute(insert(QuestionTag), links)
+
+    answers = []
+    for question_id, count in zip(question_ids, answer_counts):
+        answers.extend({
+            'body': f'Answer {len(answers)}',
+            'question_id': question_id,
+            'user_id': generator.choice(user_ids),
+        } for _ in range(count))
+    if answers:
+        db.session.execute(insert(Answer), answers)
+    answer_ids = list(db.session.scalars(db.select(Answer.id).order_by(Answer.id)))
+
+    votes, tallies = [], []
+    for answer_id in answer_ids:
+        voters = generator.sample(user_ids, min(votes_per_answer, len(user_ids)))
+        upvotes = 0
+        for user_id in voters:
+            upvote = generator.random() < 0.7
+            upvotes += upvote
+            votes.append({'answer_id': answer_id, 'user_id': user_id,
+                          'upvote': upvote, 'downvote': not upvote})
+        tallies.append({'id': answer_id, 'upvote_count': upvotes,
+                        'downvote_count': len(voters) - upvotes})
+    if votes:
+        db.session.execute(insert(Vote), votes)
+        db.session.execute(db.update(Answer), tallies)
+
+    if articles:
+        db.session.execute(insert(Article), [{
+            'title': f'Article {i}',
+            'body': f'Body of article {i}',
+            'user_id': generator.choice(user_ids),
+        } for i in range(articles)])
+
+    db.session.commit()
+
+    return {
+        'users': len(user_ids),
+        'questions': len(question_ids),
+        'answers': len(answer_ids),
+        'votes': len(votes),
+        'articles': articles,
+    }
@@ -0,0 +1,63 @@
+import threading
+from functools import wraps
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+"""
+StatementCounter
+    counts the SQL statements issued by the current thread, on every engine,
+    while the block is active.
+
+    with StatementCounter() as counter:
+        client.get('/questions/1')
+    assert counter.count <= 3
+"""
+class StatementCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.parameters = []
+        self._thread = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+            self.statements.append(statement)
+            self.parameters.append(parameters)
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
+
+"""
+statement_budget(limit)
+    test hook for endpoints: when the app is configured with
+    `ENFORCE_STATEMENT_BUDGETS`, a request that issues more than `limit`
+    statements fails with an AssertionError listing what was executed.
+    benchmarks/load.py (client mode) and benchmarks/query_plans.py turn it on.
+"""
+def statement_budget(limit):
+    def statement_budget_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('ENFORCE_STATEMENT_BUDGETS', False):
+                return f(*args, **kwargs)
+
+            with StatementCounter() as counter:
+                response = f(*args, **kwargs)
+
+            assert counter.count <= limit, (
+                f'{f.__name__} issued {counter.count} statements '
+                f'(budget {limit}): {counter.statements}'
+            )
+            return response
+
+        return wrapper
+    return statement_budget_decorator
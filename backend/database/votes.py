@@ -0,0 +1,123 @@
+from collections import namedtuple
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from cache import invalidate
+from .models import db, Answer, Vote
+
+Tally = namedtuple('Tally', ['owner_id', 'question_id', 'upvotes', 'downvotes'])
+
+"""
+UPSERT_VOTE
+    records a vote and returns the answer's new tallies in one round-trip.
+
+    - `target` reads the answer once; nothing is written for a missing answer
+      or for a vote on one's own answer.
+    - `ballot` inserts the vote, or flips an existing opposite vote through the
+      (user_id, answer_id) unique index. Repeating the same vote returns no
+      row, and `xmax = 0` tells an insert apart from a flip.
+    - `tally` shifts the counters only when `ballot` changed something.
+"""
+UPSERT_VOTE = text("""
+    WITH target AS (
+        SELECT id, user_id, question_id, upvote_count, downvote_count
+        FROM answer WHERE id = :answer_id
+    ), ballot AS (
+        INSERT INTO vote (answer_id, user_id, upvote, downvote)
+        SELECT target.id, :user_id, :upvote, :downvote FROM target
+        WHERE target.user_id IS DISTINCT FROM :user_id
+        ON CONFLICT (user_id, answer_id) DO UPDATE
+            SET upvote = excluded.upvote, downvote = excluded.downvote
+            WHERE vote.upvote IS DISTINCT FROM excluded.upvote
+        RETURNING (xmax = 0) AS inserted
+    ), tally AS (
+        UPDATE answer SET
+            upvote_count = answer.upvote_count
+                + CASE WHEN ballot.inserted THEN :inserted_up ELSE :flipped_up END,
+            downvote_count = answer.downvote_count
+                + CASE WHEN ballot.inserted THEN :inserted_down ELSE :flipped_down END,
+            version = answer.version + 1
+        FROM ballot
+        WHERE answer.id = :answer_id
+        RETURNING answer.upvote_count, answer.downvote_count
+    )
+    SELECT target.user_id,
+           target.question_id,
+           coalesce(tally.upvote_count, target.upvote_count),
+           coalesce(tally.downvote_count, target.downvote_count)
+    FROM target LEFT JOIN tally ON true
+""")
+
+"""
+cast_vote(answer_id, user_id, upvote)
+    records an upvote (or a downvote when `upvote` is False) and returns the
+    answer's Tally, or None when the answer does not exist. Votes on one's own
+    answer are not recorded; the caller checks `owner_id`.
+"""
+def cast_vote(answer_id, user_id, upvote):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        tally = _upsert_vote(answer_id, user_id, upvote)
+    else:
+        tally = _fallback_vote(answer_id, user_id, upvote)
+
+    db.session.commit()
+
+    if tally is not None:
+        invalidate(f'question:{tally.question_id}', f'answers:{tally.question_id}')
+    return tally
+
+def _upsert_vote(answer_id, user_id, upvote):
+    step = 1 if upvote else -1
+    row = db.session.execute(UPSERT_VOTE, {
+        'answer_id': answer_id,
+        'user_id': user_id,
+        'upvote': upvote,
+        'downvote': not upvote,
+        'inserted_up': int(upvote),
+        'inserted_down': int(not upvote),
+        'flipped_up': step,
+        'flipped_down': -step,
+    }).first()
+
+    if row is None:
+        return None
+    return Tally(*row)
+
+def _fallback_vote(answer_id, user_id, upvote):
+    # Databases without data-modifying CTEs (SQLite in tests) run the same
+    # steps as separate statements inside one transaction.
+    answer = db.session.get(Answer, answer_id)
+    if answer is None:
+        return None
+
+    tally = Tally(answer.user_id, answer.question_id, answer.upvote_count, answer.downvote_count)
+    if answer.user_id == user_id:
+        return tally
+
+    vote = _find_vote(answer_id, user_id)
+    step = 1 if upvote else -1
+
+    if vote is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Vote(upvote = upvote, downvote = not upvote, answer_id = answer_id, user_id = user_id))
+        except IntegrityError:
+            # A concurrent first vote by the same user was inserted first;
+            # this one flips it, or repeats it, like any later vote.
+            vote = _find_vote(answer_id, user_id)
+            db.session.refresh(answer)
+            tally = Tally(answer.user_id, answer.question_id, answer.upvote_count, answer.downvote_count)
+        else:
+            counts = Answer.count_vote(answer_id, upvotes = int(upvote), downvotes = int(not upvote))
+            return Tally(answer.user_id, answer.question_id, *counts)
+
+    if vote is None or vote.upvote == upvote:
+        return tally
+
+    vote.upvote = upvote
+    vote.downvote = not upvote
+    counts = Answer.count_vote(answer_id, upvotes = step, downvotes = -step)
+    return Tally(answer.user_id, answer.question_id, *counts)
+
+def _find_vote(answer_id, user_id):
+    return Vote.query.filter(Vote.user_id == user_id, Vote.answer_id == answer_id).first()
@@ -0,0 +1,171 @@
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import bcrypt
+
+from metrics import timed
+
+# bcrypt cost factor for new hashes; stored hashes with another cost are
+# upgraded on the next successful login.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Worker processes doing bcrypt; 0 hashes inline on the request thread.
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+# Hashing jobs allowed to wait for a worker before requests are turned away.
+HASH_QUEUE_SIZE = int(os.environ.get('HASH_QUEUE_SIZE', 64))
+HASH_QUEUE_TIMEOUT = float(os.environ.get('HASH_QUEUE_TIMEOUT', 5))
+
+LOGIN_ATTEMPTS = int(os.environ.get('LOGIN_ATTEMPTS', 10))
+LOGIN_WINDOW = float(os.environ.get('LOGIN_WINDOW', 60))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+"""
+HashingService
+    runs bcrypt in a bounded process pool so a login or registration does not
+    hold a Flask worker's interpreter for the whole hash. The pool starts on
+    first use, which keeps it out of processes that fork before serving.
+
+    Concurrent checks of the same password against the same hash (a client
+    retrying a slow login) share one bcrypt run.
+"""
+class HashingService:
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.rounds = rounds
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+
+    def _executor(self):
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid():
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                self.pid = os.getpid()
+            return self.pool
+
+    def shutdown(self):
+        # Stops this process's pool, for processes that exit without running
+        # atexit handlers; its workers would otherwise outlive them.
+        with self.lock:
+            if self.pool is not None and self.pid == os.getpid():
+                self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def _run(self, fn, *args):
+        with timed('bcrypt'):
+            if self.workers <= 0:
+                return fn(*args)
+
+            if not self.slots.acquire(timeout=HASH_QUEUE_TIMEOUT):
+                raise HashingBusy()
+            try:
+                return self._executor().submit(fn, *args).result()
+            finally:
+                self.slots.release()
+
+    def hash_password(self, password):
+        return self._run(_hashpw, password.encode(), self.rounds).decode()
+
+    def hash_passwords(self, passwords):
+        # Spreads a batch (bulk imports) over every worker. Each job takes a
+        # queue slot, so logins still get their share of the pool.
+        if self.workers <= 0:
+            return [self.hash_password(password) for password in passwords]
+
+        with timed('bcrypt'):
+            futures = []
+            for password in passwords:
+                self.slots.acquire()
+                future = self._executor().submit(_hashpw, password.encode(), self.rounds)
+                future.add_done_callback(lambda _: self.slots.release())
+                futures.append(future)
+            return [future.result().decode() for future in futures]
+
+    def check_password(self, password, hashed):
+        key = hashlib.sha256(password.encode() + b'\0' + hashed.encode()).digest()
+
+        with self.lock:
+            shared = self.pending.get(key)
+            if shared is None:
+                future = self.pending[key] = Future()
+        if shared is not None:
+            with timed('bcrypt'):
+                return shared.result()
+
+        try:
+            result = self._run(_checkpw, password.encode(), hashed.encode())
+            future.set_result(result)
+            return result
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt+digest>.
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+hasher = HashingService()
+
+"""
+LoginLimiter
+    sliding-window limit on failed logins per (client address, username), so
+    a burst of wrong guesses cannot queue unbounded bcrypt work. Only failures
+    count, and a successful login clears them, so another client cannot lock
+    a user out by guessing wrong for them.
+"""
+class LoginLimiter:
+
+    def __init__(self, attempts=LOGIN_ATTEMPTS, window=LOGIN_WINDOW, max_keys=10000):
+        self.attempts = attempts
+        self.window = window
+        self.max_keys = max_keys
+        self.history = {}
+        self.lock = threading.Lock()
+
+    def _stamps(self, key, now):
+        stamps = self.history.get(key)
+        while stamps and stamps[0] <= now - self.window:
+            stamps.popleft()
+        return stamps
+
+    def allow(self, key):
+        with self.lock:
+            stamps = self._stamps(key, time.monotonic())
+            return not stamps or len(stamps) < self.attempts
+
+    def fail(self, key):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.history) > self.max_keys:
+                self.history = {key: stamps for key, stamps in self.history.items()
+                                if stamps and stamps[-1] > now - self.window}
+
+            self._stamps(key, now)
+            self.history.setdefault(key, deque()).append(now)
+
+    def reset(self, key):
+        with self.lock:
+            self.history.pop(key, None)
+
+login_limiter = LoginLimiter()
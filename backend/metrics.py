@@ -0,0 +1,260 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+"""
+Request metrics.
+
+Every request records its latency, the SQL statements it issued and the time
+spent in them, and the time spent on bcrypt and JWT work. They are:
+
+    - summed into per-route histograms, rendered as Prometheus text on
+      GET /metrics;
+    - sent back as a `Server-Timing` header, for browser dev tools;
+    - logged with the statements issued when a request takes longer than
+      SLOW_REQUEST_SECONDS.
+
+Histograms live in the process that served the request: scrape every worker,
+or aggregate, when running several.
+"""
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1))
+# Statements kept per request for the slow-request log.
+SLOW_REQUEST_STATEMENTS = int(os.environ.get('SLOW_REQUEST_STATEMENTS', 50))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name: (type, help, buckets)
+METRICS = {
+    'stc_requests_total': (
+        'counter', 'Requests served.', None),
+    'stc_slow_requests_total': (
+        'counter', 'Requests slower than SLOW_REQUEST_SECONDS.', None),
+    'stc_request_duration_seconds': (
+        'histogram', 'Time to produce a response.', LATENCY_BUCKETS),
+    'stc_request_db_statements': (
+        'histogram', 'SQL statements issued per request.', STATEMENT_BUCKETS),
+    'stc_request_db_seconds': (
+        'histogram', 'Time spent executing SQL per request.', LATENCY_BUCKETS),
+    'stc_request_bcrypt_seconds': (
+        'histogram', 'Time spent hashing or checking passwords per request.', LATENCY_BUCKETS),
+    'stc_request_jwt_seconds': (
+        'histogram', 'Time spent signing or verifying tokens per request.', LATENCY_BUCKETS),
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        # Prometheus buckets are cumulative.
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '_bucket', {'le': _number(bound)}, total
+        yield '_bucket', {'le': '+Inf'}, total + self.counts[-1]
+        yield '_sum', {}, self.sum
+        yield '_count', {}, total + self.counts[-1]
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+"""
+Registry
+    the counters and histograms of this process, keyed by metric name and
+    label values.
+"""
+class Registry:
+
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self.series = {name: {} for name in metrics}
+        self.lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(self.metrics[name][2])
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help, _) in self.metrics.items():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in sorted(self.series[name].items()):
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                        continue
+                    for suffix, extra, sample in value.samples():
+                        lines.append(f'{name}{suffix}{_labels(labels + tuple(extra.items()))} '
+                                     f'{_number(sample)}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+"""
+RequestTimings
+    what one request spent, kept on flask.g while it is served.
+"""
+class RequestTimings:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.timers = {}
+        # (seconds, statement) pairs for the slow-request log.
+        self.log = []
+
+    def add(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def record_statement(self, statement, seconds):
+        self.statements += 1
+        self.db_seconds += seconds
+        if len(self.log) < SLOW_REQUEST_STATEMENTS:
+            self.log.append((seconds, statement))
+
+def _current():
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+"""
+timed(name)
+    adds the time spent in the block to the current request's `name` timer.
+    Outside a request, or before the metrics hooks ran, it only runs the block.
+
+    with timed('bcrypt'):
+        bcrypt.checkpw(password, hashed)
+"""
+@contextmanager
+def timed(name):
+    timings = _current()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_start')
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+
+    timings = _current()
+    if timings is not None:
+        timings.record_statement(statement, seconds)
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    if context.connection is not None and context.statement is not None:
+        starts = context.connection.info.get('metrics_start')
+        if starts:
+            starts.pop()
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+def _start_request():
+    g.timings = RequestTimings()
+
+def _server_timing(timings, seconds):
+    entries = [f'app;dur={seconds * 1000:.1f}',
+               f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.statements} statements"']
+    entries.extend(f'{name};dur={spent * 1000:.1f}' for name, spent in sorted(timings.timers.items()))
+    return ', '.join(entries)
+
+def _finish_request(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+
+    # A streamed body is still to be generated: this times the first part.
+    seconds = time.perf_counter() - timings.start
+    labels = {'method': request.method, 'route': _route()}
+
+    registry.inc('stc_requests_total', {**labels, 'status': str(response.status_code)})
+    registry.observe('stc_request_duration_seconds', labels, seconds)
+    registry.observe('stc_request_db_statements', labels, timings.statements)
+    registry.observe('stc_request_db_seconds', labels, timings.db_seconds)
+    for name in ('bcrypt', 'jwt'):
+        if name in timings.timers:
+            registry.observe(f'stc_request_{name}_seconds', labels, timings.timers[name])
+
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = _server_timing(timings, seconds)
+
+    if seconds >= SLOW_REQUEST_SECONDS:
+        registry.inc('stc_slow_requests_total', labels)
+        _log_slow_request(timings, seconds, response)
+
+    return response
+
+def _log_slow_request(timings, seconds, response):
+    lines = [f'slow request: {request.method} {request.full_path.rstrip("?")} '
+             f'-> {response.status_code} in {seconds * 1000:.1f} ms, '
+             f'{timings.statements} statements in {timings.db_seconds * 1000:.1f} ms'
+             + ''.join(f', {name} {spent * 1000:.1f} ms' for name, spent in sorted(timings.timers.items()))]
+    lines.extend(f'    {spent * 1000:8.1f} ms  {" ".join(statement.split())}'
+                 for spent, statement in timings.log)
+    if timings.statements > len(timings.log):
+        lines.append(f'    ... {timings.statements - len(timings.log)} more')
+    current_app.logger.warning('\n'.join(lines))
+
+"""
+init_metrics(app)
+    times every request of `app` and every statement run on any engine.
+"""
+def init_metrics(app):
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,108 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from flask import abort
+from sqlalchemy import DateTime, literal, tuple_
+
+QUESTIONS_PER_PAGE = 10
+
+"""
+encode_cursor(values) / decode_cursor(cursor)
+    opaque, url-safe cursors holding the sort key of the last row of a page.
+"""
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        abort(400)
+
+def _dump(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _load(column, value):
+    if isinstance(column.type, DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            abort(400)
+    if not isinstance(value, (int, float, str)):
+        abort(400)
+    return value
+
+"""
+sort_order(request, sorts, default)
+    resolves `?sort=` against the sorts an endpoint offers, each a
+    (key columns, descending) pair. Unknown sorts are a bad request.
+"""
+def sort_order(request, sorts, default):
+    sort = request.args.get('sort', default)
+    if sort not in sorts:
+        abort(400)
+    return sorts[sort]
+
+"""
+paginate(request, query, order, formatter, descending=False, cursor_arg='after')
+    pushes the page window into SQL instead of slicing a fully loaded table.
+
+    `order` is a tuple of columns forming a unique sort key, ending with the
+    primary key, e.g. (Question.created_at, Question.id); an index on the same
+    columns turns every page into an index range scan.
+
+    - `?after=<cursor>` walks the rows with a keyset predicate on the key
+      (`cursor_arg` renames the parameter).
+    - `?page=<n>` is kept for old clients and runs as LIMIT/OFFSET.
+
+    One extra row is fetched to know whether another page exists, and only the
+    rows of the current page are passed to `formatter`, one at a time; without
+    a formatter the rows are returned as they are.
+
+    The two halves, page_query() and page_rows(), also work on a select()
+    run by another session (see asgi.py).
+"""
+def paginate(request, query, order, formatter, descending=False, per_page=QUESTIONS_PER_PAGE,
+             cursor_arg='after'):
+    query = page_query(request, query, order, descending, per_page, cursor_arg)
+    return page_rows(query.all(), order, formatter, per_page)
+
+def page_query(request, query, order, descending=False, per_page=QUESTIONS_PER_PAGE,
+               cursor_arg='after'):
+    cursor = request.args.get(cursor_arg, None)
+    query = query.order_by(*[column.desc() if descending else column for column in order])
+
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(order):
+            abort(400)
+
+        key = tuple_(*order)
+        last = tuple_(*[literal(_load(column, value), column.type) for column, value in zip(order, values)])
+        query = query.filter(key < last if descending else key > last)
+    else:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(400)
+        query = query.offset((page - 1) * per_page)
+
+    return query.limit(per_page + 1)
+
+def page_rows(rows, order, formatter, per_page=QUESTIONS_PER_PAGE):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor([_dump(getattr(rows[-1], column.key)) for column in order])
+
+    if formatter is not None:
+        rows = [formatter(row) for row in rows]
+
+    return rows, {
+        'has_more': has_more,
+        'next_cursor': next_cursor,
+    }
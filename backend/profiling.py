@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import tempfile
+import threading
+from collections import Counter
+from flask import g, request, current_app
+
+from auth import AuthError, get_token_claims
+
+"""
+Request profiling.
+
+A profiled request is sampled from a background thread: every
+PROFILE_INTERVAL_MS its Python stack is read and counted. Nothing runs for
+requests that are not profiled. A request is profiled when
+
+    - a manager sends `X-Profile: 1` with their bearer token, or
+    - it is drawn at PROFILE_SAMPLE_RATE (0 to 1, default 0), optionally only
+      among the endpoints listed in PROFILE_ENDPOINTS, e.g.
+      `question_detail,search_articles`.
+
+Profiles are kept as files in PROFILE_DIR, shared by every worker of the
+host, up to the last PROFILE_KEEP. They hold collapsed stacks
+(`frame;frame;frame count` lines) that flamegraph.pl, speedscope and similar
+tools read. A profiled response names its profile in the `X-Profile-Id`
+header. The body of a streamed response is written after the profile ends.
+"""
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_ENDPOINTS = {name for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if name}
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 100))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'stc-profiles'))
+
+
+def _frame_names():
+    # Longest sys.path entries first, so files are named from their package.
+    roots = sorted((os.path.abspath(path) + os.sep for path in sys.path if path),
+                   key=len, reverse=True)
+    names = {}
+
+    def name(code):
+        label = names.get(code)
+        if label is None:
+            filename = code.co_filename
+            for root in roots:
+                if filename.startswith(root):
+                    filename = filename[len(root):]
+                    break
+            label = names[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+        return label
+
+    return name
+
+"""
+Sampler
+    counts the stacks of one thread until stopped.
+"""
+class Sampler(threading.Thread):
+
+    frame_name = staticmethod(_frame_names())
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.halt = threading.Event()
+
+    def run(self):
+        while not self.halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.halt.set()
+        self.join()
+        return self.stacks
+
+"""
+ProfileStore
+    the most recent profiles of the host's workers, one JSON file each,
+    named by the profile's uuid.
+"""
+class ProfileStore:
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def next_id(self):
+        return str(uuid.uuid4())
+
+    def _path(self, id):
+        return os.path.join(self.directory, f'{id}.json')
+
+    def _paths(self):
+        try:
+            return [entry.path for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+
+    def _read(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            # Pruned, or being replaced, by another worker.
+            return None
+
+    def add(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(profile.id)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(profile.record(), file)
+        os.replace(temporary, path)
+        self._prune()
+
+    def _prune(self):
+        paths = []
+        for path in self._paths():
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass
+        for _, path in sorted(paths)[:-self.keep or None]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def list(self, route=None):
+        summaries = [record['summary'] for record in map(self._read, self._paths()) if record is not None]
+        summaries.sort(key=lambda summary: summary['started'], reverse=True)
+        return [summary for summary in summaries[:self.keep]
+                if route is None or summary['route'] == route]
+
+    def get(self, id):
+        # The record of profile `id`: its `summary` and `collapsed` stacks.
+        return self._read(self._path(id))
+
+profiles = ProfileStore()
+
+
+class Profile:
+
+    def __init__(self, id, reason):
+        self.id = id
+        self.reason = reason
+        self.method = request.method
+        self.path = request.full_path.rstrip('?')
+        self.endpoint = request.endpoint
+        self.route = request.url_rule.rule if request.url_rule is not None else None
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.stacks = None
+        self.sampler = Sampler(threading.get_ident())
+        self.sampler.start()
+
+    def finish(self):
+        self.stacks = self.sampler.stop()
+        self.duration = time.perf_counter() - self.start
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'reason': self.reason,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'route': self.route,
+            'started': self.started,
+            'duration_ms': round(self.duration * 1000, 3),
+            'samples': sum(self.stacks.values()),
+            'interval_ms': PROFILE_INTERVAL_MS,
+        }
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def record(self):
+        return {'summary': self.summary(), 'collapsed': self.collapsed()}
+
+
+def _requested_by_manager():
+    if request.headers.get(PROFILE_HEADER, '').lower() not in ('1', 'true', 'yes', 'on'):
+        return False
+    try:
+        return get_token_claims().get('role') == 'manager'
+    except AuthError:
+        # Not allowed to profile: the request is served as usual.
+        return False
+
+def _drawn():
+    if PROFILE_SAMPLE_RATE <= 0:
+        return False
+    # Views are named with or without their blueprint: `api.question_detail`.
+    endpoint = request.endpoint or ''
+    if PROFILE_ENDPOINTS and not {endpoint, endpoint.rpartition('.')[2]} & PROFILE_ENDPOINTS:
+        return False
+    return random.random() < PROFILE_SAMPLE_RATE
+
+def _start_profile():
+    if _requested_by_manager():
+        g.profile = Profile(profiles.next_id(), 'header')
+    elif _drawn():
+        g.profile = Profile(profiles.next_id(), 'sampled')
+
+def _name_profile(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = str(profile.id)
+    return response
+
+def _finish_profile(error=None):
+    # Teardown also runs when the view raised, unlike after_request.
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.finish()
+        try:
+            profiles.add(profile)
+        except OSError as write_error:
+            current_app.logger.warning(f'profile {profile.id} not saved: {write_error}')
+
+"""
+init_profiling(app)
+    profiles the requests of `app` that ask for it or are drawn.
+"""
+def init_profiling(app):
+    app.before_request(_start_profile)
+    app.after_request(_name_profile)
+    app.teardown_request(_finish_profile)
@@ -0,0 +1,226 @@
+import re
+import sys
+import bisect
+import threading
+from collections import defaultdict
+from flask import abort
+from sqlalchemy import and_, event, func, literal_column, or_, select
+
+from database.models import db, User, Question, QuestionTag, Tag, Article
+from pagination import QUESTIONS_PER_PAGE
+
+# ts_rank's default weights for the 'A' and 'B' labels.
+WEIGHTS = {'A': 1.0, 'B': 0.4}
+
+# Columns indexed per model, with their weight label.
+SEARCHABLE = {
+    Question: (('title', 'A'), ('body', 'B')),
+    Article: (('title', 'A'), ('body', 'B')),
+}
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+"""
+InvertedIndex
+    in-process fallback for databases without full-text search (SQLite test
+    runs). Maps each term to the weighted documents containing it; the last
+    search term is matched as a prefix, like the `:*` of the PostgreSQL query.
+
+    The index is loaded on first use and then kept current by mapper events.
+"""
+class InvertedIndex:
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = SEARCHABLE[model]
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.vocabulary = []
+        self.loaded = False
+        self.lock = threading.RLock()
+
+        event.listen(model, 'after_insert', self._on_write)
+        event.listen(model, 'after_update', self._on_write)
+        event.listen(model, 'after_delete', self._on_delete)
+
+    def _on_write(self, mapper, connection, target):
+        if self.loaded:
+            self.add(target.id, [getattr(target, name) for name, _ in self.fields])
+
+    def _on_delete(self, mapper, connection, target):
+        if self.loaded:
+            self.remove(target.id)
+
+    def reset(self):
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.vocabulary = []
+            self.loaded = False
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            columns = [getattr(self.model, name) for name, _ in self.fields]
+            for row in db.session.query(self.model.id, *columns):
+                self.add(row[0], row[1:])
+            self.loaded = True
+
+    def add(self, doc_id, values):
+        with self.lock:
+            self.remove(doc_id)
+            weights = defaultdict(float)
+            for (_, label), value in zip(self.fields, values):
+                for term in tokenize(value):
+                    weights[term] += WEIGHTS[label]
+
+            for term, weight in weights.items():
+                if term not in self.postings:
+                    bisect.insort(self.vocabulary, term)
+                self.postings[term][doc_id] = weight
+            self.documents[doc_id] = list(weights)
+
+    def remove(self, doc_id):
+        with self.lock:
+            for term in self.documents.pop(doc_id, []):
+                self.postings[term].pop(doc_id, None)
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, terms):
+        # Returns [(doc_id, score)] ordered by relevance, then id.
+        self.load()
+        with self.lock:
+            scores = None
+            for position, term in enumerate(terms):
+                if position == len(terms) - 1:
+                    expanded = self._expand(term)
+                else:
+                    expanded = [term]
+
+                matches = defaultdict(float)
+                for match in expanded:
+                    for doc_id, weight in self.postings.get(match, {}).items():
+                        matches[doc_id] += weight
+
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {doc_id: score + matches[doc_id]
+                              for doc_id, score in scores.items() if doc_id in matches}
+
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+
+INDEXES = {model: InvertedIndex(model) for model in SEARCHABLE}
+
+def to_tsquery(terms):
+    # Every term must match; the last one is a prefix of the word being typed.
+    return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+
+"""
+author_match(name) / articles_by_author(name)
+    case-insensitive prefix match on the author's username, served by the
+    lower(username) index, and the ids of the articles it matches joined
+    through article.user_id.
+"""
+def author_match(name):
+    username = func.lower(User.username)
+    prefix = name.lower()
+
+    # SQLite cannot serve LIKE from an expression index, but can a range: in
+    # code point order, the names starting with `prefix` sort below the
+    # prefix with its last character incremented.
+    if (db.session.get_bind().dialect.name != 'postgresql'
+            and prefix and ord(prefix[-1]) < sys.maxunicode):
+        return and_(username >= prefix, username < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+    # On PostgreSQL, text_pattern_ops serves LIKE 'prefix%'.
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return username.like(pattern + '%', escape='\\')
+
+def articles_by_author(name):
+    return (select(Article.id)
+        .join(User, Article.user_id == User.id)
+        .where(author_match(name)))
+
+"""
+questions_by_tag(search_term)
+    the ids of the questions tagged with any of the search terms, looked up
+    through the tag name and (tag_id, question_id) indexes.
+"""
+def questions_by_tag(search_term):
+    return (select(QuestionTag.question_id.label('id'))
+        .join(Tag, QuestionTag.tag_id == Tag.id)
+        .where(Tag.name.in_([Tag.normalize(term) for term in search_term.split()]))
+        .distinct())
+
+"""
+search(request, query, model, search_term, extra=None)
+    relevance-ordered, page-numbered full-text search over `model`.
+
+    `query` carries the caller's load plan, and `extra` is an optional select
+    of ids whose rows are kept but ranked after the text matches.
+    Returns (rows, {'has_more': ..., 'page': ...}).
+"""
+def search(request, query, model, search_term, extra=None, per_page=QUESTIONS_PER_PAGE):
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        abort(400)
+
+    terms = tokenize(search_term)
+    offset = (page - 1) * per_page
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        rows = _search_postgresql(query, model, terms, extra, offset, per_page + 1)
+    else:
+        rows = _search_index(query, model, terms, extra, offset, per_page + 1)
+
+    return rows[:per_page], {
+        'has_more': len(rows) > per_page,
+        'page': page,
+    }
+
+def _search_postgresql(query, model, terms, extra, offset, limit):
+    criteria = []
+    rank = literal_column('0')
+
+    if terms:
+        vector = literal_column(f'{model.__tablename__}.search_vector')
+        tsquery = func.to_tsquery('english', to_tsquery(terms))
+        criteria.append(vector.op('@@')(tsquery))
+        rank = func.ts_rank(vector, tsquery)
+    if extra is not None:
+        criteria.append(model.id.in_(extra))
+    if not criteria:
+        return []
+
+    return (query
+        .filter(or_(*criteria))
+        .order_by(rank.desc(), model.id)
+        .offset(offset)
+        .limit(limit)
+        .all())
+
+def _search_index(query, model, terms, extra, offset, limit):
+    ranked = INDEXES[model].search(terms) if terms else []
+
+    if extra is not None:
+        found = {doc_id for doc_id, _ in ranked}
+        for (doc_id,) in db.session.execute(extra.order_by(*extra.selected_columns)):
+            if doc_id not in found:
+                found.add(doc_id)
+                ranked.append((doc_id, 0))
+
+    ids = [doc_id for doc_id, _ in ranked[offset:offset + limit]]
+    if not ids:
+        return []
+
+    rows = {row.id: row for row in query.filter(model.id.in_(ids))}
+    return [rows[doc_id] for doc_id in ids if doc_id in rows]
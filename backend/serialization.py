@@ -0,0 +1,147 @@
+import os
+import uuid
+import decimal
+from datetime import date
+from dataclasses import dataclass, is_dataclass
+from flask.json.provider import JSONProvider, DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from database.models import stamp
+from database.projections import EXCERPT_LENGTH, question_tags
+
+"""
+JSON providers.
+
+`ORJSONProvider` encodes responses with orjson, which also writes dataclass
+rows natively. Without orjson installed, or with JSON_PROVIDER=json, Flask's
+standard provider is kept. Keys are not sorted by either: clients must not
+rely on key order.
+"""
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+
+
+def _default(o):
+    # What Flask's provider encodes beyond plain JSON, in the same forms.
+    # Response rows are flat: their __dict__ is what asdict() would build,
+    # without copying every field.
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if is_dataclass(o) and not isinstance(o, type):
+        return o.__dict__
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class ORJSONProvider(JSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+class StandardJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    default = staticmethod(_default)
+
+
+def create_json_provider(app, name=JSON_PROVIDER):
+    if name == 'orjson' and orjson is not None:
+        return ORJSONProvider(app)
+    return StandardJSONProvider(app)
+
+"""
+Response rows.
+
+Dataclasses with exactly the fields an endpoint renders, built from the
+projected rows of database/projections.py (answers, which are shown in
+full, from entities). A listing needs no dict per row, and orjson writes them
+without a Python-level callback. They are deliberately not slotted: orjson
+(3.8) encodes a dataclass about four times faster from its __dict__ than
+through __slots__.
+"""
+def _excerpt(text):
+    # (body shown in listings, whether it was cut)
+    return text[:EXCERPT_LENGTH], len(text) > EXCERPT_LENGTH
+
+
+@dataclass
+class QuestionSummary:
+    id: int
+    title: str
+    body: str
+    truncated: bool
+    tags: list
+    answer_count: int
+    created_on: str
+    user: str
+    user_id: int
+    role: str
+
+    @classmethod
+    def from_row(cls, row, tags):
+        body, truncated = _excerpt(row.excerpt)
+        return cls(row.id, row.title, body, truncated, tags, row.answer_count,
+                   stamp(row.created_at), row.username, row.user_id, row.role)
+
+    @classmethod
+    def from_rows(cls, rows, tags=None):
+        # `tags` as from question_tags(); read from db.session when not given.
+        if tags is None:
+            tags = question_tags([row.id for row in rows])
+        return [cls.from_row(row, tags[row.id]) for row in rows]
+
+
+@dataclass
+class AnswerSummary:
+    id: int
+    body: str
+    created_on: str
+    question_id: int
+    user: str
+    user_id: int
+    role: str
+    upvotes: int
+    downvotes: int
+
+    @classmethod
+    def from_entity(cls, answer):
+        user = answer.user
+        return cls(answer.id, answer.body, stamp(answer.created_at), answer.question_id,
+                   user.username, answer.user_id, user.role,
+                   answer.upvote_count, answer.downvote_count)
+
+
+@dataclass
+class ArticleSummary:
+    id: int
+    title: str
+    body: str
+    truncated: bool
+    created_on: str
+    updated_on: str
+    first_name: str
+    last_name: str
+    user: str
+    user_id: int
+    role: str
+
+    @classmethod
+    def from_row(cls, row):
+        body, truncated = _excerpt(row.excerpt)
+        return cls(row.id, row.title, body, truncated,
+                   stamp(row.created_at), stamp(row.updated_at),
+                   row.first_name, row.last_name, row.username, row.user_id, row.role)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls.from_row(row) for row in rows]
@@ -0,0 +1,110 @@
+import os
+import argparse
+from gunicorn.app.base import BaseApplication
+from sqlalchemy.orm import configure_mappers
+
+from app import create_app
+from cache import share_cache
+from database.models import db
+
+"""
+Production server: a gunicorn master that preforks workers.
+
+    python server.py --bind 0.0.0.0:8000 --workers 4
+    python server.py --asgi     # the ASGI app of asgi.py, on uvicorn workers
+
+The master builds the app once, before any worker exists: it imports every
+module, creates missing tables (unless DB_CREATE_SCHEMA=false), and
+configures the mappers. It then closes the connections it opened. Workers are
+forked from it. They share its memory copy-on-write, start serving at once, and
+never check the schema themselves.
+
+Signals to the master:
+
+    HUP      replaces the workers once they finish their requests. The new
+             ones are forked from the same app: settings are reread, code is not.
+    USR2     starts a new master on the code now on disk, next to this one.
+             Then send WINCH to this master to stop its workers, and QUIT to
+             stop it, once the new one is serving.
+    TERM     stops, letting requests finish for up to SERVER_GRACEFUL_TIMEOUT.
+
+Settings come from the environment, or from the options of the same name:
+SERVER_BIND, SERVER_WORKERS, SERVER_THREADS (threads per WSGI worker; keep it
+within DB_POOL_SIZE + DB_MAX_OVERFLOW), SERVER_TIMEOUT and
+SERVER_GRACEFUL_TIMEOUT, in seconds.
+
+With more than one worker the in-process response cache is disabled, since a
+write only invalidates it in its own worker; set CACHE_URL to share one.
+"""
+SERVER_BIND = os.environ.get('SERVER_BIND', '127.0.0.1:8000')
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 30))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+
+"""
+load_app(config=None, asgi=False)
+    the app the workers serve, ready to be forked: built, mappers configured,
+    and no connection left open to be shared between processes.
+"""
+def load_app(config=None, asgi=False):
+    if asgi:
+        from asgi import create_application
+        application = create_application(config)
+        app = application.flask_app
+    else:
+        application = app = create_app(config)
+
+    configure_mappers()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    return application
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options, config=None, asgi=False):
+        self.options = options
+        self.config = config
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return load_app(self.config, self.asgi)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the app from preforked workers.')
+    parser.add_argument('--bind', default=SERVER_BIND)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    parser.add_argument('--timeout', type=int, default=SERVER_TIMEOUT)
+    parser.add_argument('--graceful-timeout', type=int, default=SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument('--asgi', action='store_true',
+                        help='serve asgi.py from uvicorn workers')
+    args = parser.parse_args(argv)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'preload_app': True,
+    }
+    if args.asgi:
+        options['worker_class'] = 'uvicorn_worker.UvicornWorker'
+    else:
+        options['worker_class'] = 'gthread'
+        options['threads'] = args.threads
+
+    share_cache(args.workers)
+    Server(options, asgi=args.asgi).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import os
+from flask import current_app, stream_with_context
+
+# Rows fetched per round trip, and serialized per chunk written.
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 200))
+
+"""
+stream_json(payload, key, query, formatter)
+    responds with the JSON object `payload` plus `key` holding one element per
+    row of `query`, written as the rows arrive instead of after building the
+    whole list. The query is read through a server-side cursor (yield_per), so
+    memory stays flat however many rows there are.
+
+    An error half way through can no longer change the status line; it ends
+    the response early with a body that is not valid JSON.
+
+    The query belongs to the view's session, which the request teardown has
+    already removed by the time the body is written; it is closed here so its
+    connection goes back to the pool.
+"""
+def stream_json(payload, key, query, formatter, batch_size=STREAM_BATCH_SIZE):
+    dumps = current_app.json.dumps
+
+    def generate():
+        # The payload's fields, with its closing brace left open.
+        head = dumps(payload)[:-1]
+        yield head + (', ' if payload else '') + dumps(key) + ': ['
+
+        separator, chunk = '', []
+        try:
+            for row in query.yield_per(batch_size):
+                chunk.append(dumps(formatter(row)))
+                if len(chunk) >= batch_size:
+                    yield separator + ', '.join(chunk)
+                    separator, chunk = ', ', []
+        finally:
+            query.session.close()
+        if chunk:
+            yield separator + ', '.join(chunk)
+
+        yield ']}'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,73 @@
+"""
+Compares two reports of benchmarks/load.py, route by route.
+
+    git checkout main && python benchmarks/load.py --output before.json
+    git checkout my-branch && python benchmarks/load.py --output after.json
+    python benchmarks/compare.py before.json after.json
+
+Fails when a route's p95 latency grew by more than --threshold (a fraction,
+default 0.2), when it issues half a statement per request or more than before
+(cached routes average below one), or when it has more failed requests.
+"""
+import sys
+import json
+import argparse
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'statements_per_request')
+
+
+def change(before, after):
+    if before is None or after is None:
+        return ''
+    if before == 0:
+        return '' if after == 0 else '   new'
+    return f'{(after - before) / before:+6.0%}'
+
+
+def regressions(name, before, after, threshold):
+    found = []
+    if before['p95_ms'] and after['p95_ms'] and after['p95_ms'] > before['p95_ms'] * (1 + threshold):
+        found.append(f"{name}: p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+    if (before['statements_per_request'] is not None and after['statements_per_request'] is not None
+            and after['statements_per_request'] >= before['statements_per_request'] + 0.5):
+        found.append(f"{name}: {before['statements_per_request']} -> "
+                     f"{after['statements_per_request']} statements per request")
+    if sum(after['errors'].values()) > sum(before['errors'].values()):
+        found.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two load test reports.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed p95 growth, as a fraction')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    print(f"{'route':45}" + ''.join(f'{column:>30}' for column in COLUMNS))
+    found = []
+    for name in sorted(set(before['routes']) | set(after['routes'])):
+        old, new = before['routes'].get(name), after['routes'].get(name)
+        if old is None or new is None:
+            print(f"{name:45}  {'only before' if new is None else 'only after'}")
+            continue
+
+        cells = ''.join(f'{str(old[column]):>10} {str(new[column]):>10} {change(old[column], new[column]):>8}'
+                        for column in COLUMNS)
+        print(f'{name:45}{cells}')
+        found.extend(regressions(name, old, new, args.threshold))
+
+    if found:
+        print('\n' + '\n'.join(found), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+Load test of every route in backend/app.py.
+
+Seeds a database, then drives each route in turn with a pool of concurrent
+workers and reports, per route, p50/p95/p99 latency, throughput, errors and
+SQL statements per request (read from the Server-Timing header). The report is
+JSON with stable keys, meant to be saved per commit and compared with
+benchmarks/compare.py.
+
+    python benchmarks/load.py --output before.json
+    python benchmarks/load.py --mode http --workers 16 --requests 500
+    python benchmarks/load.py --mode http --url http://127.0.0.1:5000 --no-seed
+
+Modes:
+    client  requests go through the Flask test client, in this process, with
+            ENFORCE_STATEMENT_BUDGETS on: a view that issues more statements
+            than its @statement_budget fails.
+    http    requests go over HTTP: to --url, or to the app served from a
+            threaded server in this process.
+
+Runs against a SQLite file unless DATABASE_URL is set; point it at a local
+PostgreSQL scratch database to benchmark that, its tables are dropped and
+reseeded. With --url, DATABASE_URL must be the server's database: the seed and
+the ids the routes are called with come from it.
+
+Writes act on rows the run creates itself: questions it POSTs are PATCHed and
+then DELETEd, and so on. Streamed responses (GET /users, GET /bulk/<name>)
+report the statements issued before streaming began.
+
+Exits with status 1 when any request failed, after writing the report.
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'stc_load.db')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + DATABASE)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import select
+
+from app import create_app
+from database.models import db, User, Question, Answer, Article, Tag
+from database.seed import seed
+from search import INDEXES
+
+app = create_app()
+
+PASSWORD = 'password'
+STATEMENTS = re.compile(r'\bdb;dur=[\d.]+;desc="(\d+) statements"')
+
+
+"""
+Phase
+    one route under load. `path` and `body` are templates or callables of
+    (request number, state); `save` appends a field of each response to
+    state, for the phases that follow; `limit` caps the request count.
+"""
+class Phase:
+
+    def __init__(self, method, rule, path=None, body=None, auth=True, save=None, limit=None,
+                 content_type='application/json'):
+        self.method = method
+        self.rule = rule
+        self.path = path or rule
+        self.body = body
+        self.auth = auth
+        self.save = save
+        self.limit = limit
+        self.content_type = content_type
+
+    @property
+    def name(self):
+        return f'{self.method} {self.path if isinstance(self.path, str) else self.rule}'
+
+    def build(self, i, state):
+        path = self.path(i, state) if callable(self.path) else self.path
+        body = self.body(i, state) if callable(self.body) else self.body
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        return path, body
+
+
+def pick(key):
+    return lambda i, state: state[key][i % len(state[key])] if state[key] else 0
+
+# Titles and bodies are unique, also across runs on the same database.
+def title(kind, i, state):
+    return f"{kind} {state['run']}-{i}"
+
+def text(verb, i, state):
+    return f"{verb} by load test {state['run']}, request {i}."
+
+def bulk_questions(i, state):
+    return '\n'.join(json.dumps({'title': title(f'Imported question {n}', i, state), 'body': text(f'Imported ({n})', i, state),
+                                 'tags': ['bulk']})
+                     for n in range(10))
+
+PHASES = [
+    Phase('GET', '/public', auth=False),
+    Phase('GET', '/private'),
+    Phase('GET', '/token', auth=False),
+    Phase('GET', '/questions', auth=False),
+    Phase('GET', '/questions?sort=newest', auth=False),
+    Phase('GET', '/questions?sort=top', auth=False),
+    Phase('GET', '/questions/<int:id>', lambda i, state: f"/questions/{pick('questions')(i, state)}",
+          auth=False),
+    Phase('GET', '/questions/<int:question_id>/answers',
+          lambda i, state: f"/questions/{pick('questions')(i, state)}/answers", auth=False),
+    Phase('GET', '/search-questions/?search=question', auth=False),
+    Phase('GET', '/tags/<name>/questions', lambda i, state: f"/tags/{pick('tags')(i, state)}/questions",
+          auth=False),
+    Phase('GET', '/articles', auth=False),
+    Phase('GET', '/articles/<int:id>', lambda i, state: f"/articles/{pick('articles')(i, state)}",
+          auth=False),
+    Phase('GET', '/search-articles/?search=article', auth=False),
+    Phase('GET', '/search-articles/?author=member1', auth=False),
+    Phase('GET', '/users'),
+    Phase('POST', '/users', body=lambda i, state: {
+        'username': f"bench-{state['run']}-{i}", 'password': PASSWORD, 'role': 'student'},
+        save=('new_users', 'user')),
+    Phase('PATCH', '/users/<int:user_id>', lambda i, state: f"/users/{pick('new_users')(i, state)}",
+          body={'first_name': 'Bench', 'last_name': 'Mark'}),
+    Phase('POST', '/questions', body=lambda i, state: {
+        'title': title('Question', i, state), 'body': text('Posted', i, state), 'tags': ['bench', 'load']},
+        save=('new_questions', 'question')),
+    Phase('PATCH', '/questions/<int:id>', lambda i, state: f"/questions/{pick('new_questions')(i, state)}",
+          body=lambda i, state: {
+        'title': title('Edited question', i, state), 'body': text('Edited', i, state), 'tags': ['bench']}),
+    Phase('POST', '/questions/<int:question_id>/answers',
+          lambda i, state: f"/questions/{pick('new_questions')(i, state)}/answers",
+          body=lambda i, state: {'body': text('Answered', i, state)}, save=('new_answers', 'answer')),
+    Phase('PATCH', '/answers/<int:answer_id>', lambda i, state: f"/answers/{pick('new_answers')(i, state)}",
+          body=lambda i, state: {'body': text('Edited', i, state)}),
+    Phase('GET', '/answers/<int:answer_id>/upvote',
+          lambda i, state: f"/answers/{pick('votable')(i, state)}/upvote"),
+    Phase('GET', '/answers/<int:answer_id>/downvote',
+          lambda i, state: f"/answers/{pick('votable')(i, state)}/downvote"),
+    Phase('DELETE', '/questions/<int:id>', lambda i, state: f"/questions/{pick('new_questions')(i, state)}"),
+    Phase('POST', '/articles', body=lambda i, state: {
+        'title': title('Article', i, state), 'body': text('Posted', i, state)},
+        save=('new_articles', 'article')),
+    Phase('PATCH', '/articles/<int:id>', lambda i, state: f"/articles/{pick('new_articles')(i, state)}",
+          body=lambda i, state: {'title': title('Edited article', i, state), 'body': text('Edited', i, state)}),
+    Phase('DELETE', '/articles/<int:id>', lambda i, state: f"/articles/{pick('new_articles')(i, state)}"),
+    Phase('POST', '/bulk/<name>', '/bulk/questions', body=bulk_questions,
+          content_type='application/x-ndjson', limit=20),
+    Phase('GET', '/bulk/<name>', '/bulk/articles', limit=5),
+    Phase('GET', '/database/pool'),
+    Phase('GET', '/metrics', auth=False),
+    Phase('DELETE', '/users/<int:user_id>', lambda i, state: f"/users/{pick('new_users')(i, state)}"),
+]
+
+
+class ClientTransport:
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, data=body, headers=headers)
+        return response.status_code, response.headers.get('Server-Timing', ''), response.get_data()
+
+
+class HTTPTransport:
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, body, headers):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.getheader('Server-Timing', ''), response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+
+
+def serve():
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def basic(username):
+    return 'Basic ' + base64.b64encode(f'{username}:{PASSWORD}'.encode()).decode()
+
+
+def prepare(args):
+    with app.app_context():
+        if args.seed:
+            db.drop_all()
+            db.create_all()
+            counts = seed(users=args.users, questions=args.questions,
+                          answers_per_question=args.answers, votes_per_answer=args.votes,
+                          articles=args.articles, tags=args.tags, password=PASSWORD,
+                          random_seed=args.random_seed)
+        else:
+            counts = None
+
+        # Search without PostgreSQL runs on in-process indexes, loaded once.
+        for index in INDEXES.values():
+            index.reset()
+            if db.engine.dialect.name != 'postgresql':
+                index.load()
+
+        # member2 is a manager, allowed on every route.
+        manager = db.session.scalar(select(User.id).where(User.username == 'member2'))
+        limit = max(args.requests, 1)
+        state = {
+            'run': f'{int(time.time())}-{os.getpid()}',
+            'usernames': list(db.session.scalars(select(User.username).order_by(User.id))),
+            'questions': list(db.session.scalars(select(Question.id).order_by(Question.id).limit(limit))),
+            'tags': list(db.session.scalars(select(Tag.name).order_by(Tag.id).limit(limit))),
+            'articles': list(db.session.scalars(select(Article.id).order_by(Article.id).limit(limit))),
+            'votable': list(db.session.scalars(select(Answer.id).where(Answer.user_id != manager)
+                                               .order_by(Answer.id).limit(limit))),
+            'new_users': [], 'new_questions': [], 'new_answers': [], 'new_articles': [],
+            'dialect': db.engine.dialect.name,
+        }
+        db.session.remove()
+    return counts, state
+
+
+def percentile(ordered, p):
+    # Nearest rank.
+    if not ordered:
+        return None
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def run_phase(phase, transport, state, token, args):
+    count = min(args.requests, phase.limit or args.requests)
+    timings, statements = [], []
+    errors = {}
+    lock = threading.Lock()
+
+    def one(i):
+        path, body = phase.build(i, state)
+        headers = {'Content-Type': phase.content_type}
+        if phase.auth:
+            headers['Authorization'] = 'Bearer ' + token
+        elif phase.rule == '/token':
+            # Spread logins over every user, under the per-user login limit.
+            headers['Authorization'] = basic(state['usernames'][i % len(state['usernames'])])
+
+        start = time.perf_counter()
+        try:
+            status, timing, content = transport.request(phase.method, path, body, headers)
+        except Exception as error:
+            status, timing, content = type(error).__name__, '', b''
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            timings.append(elapsed)
+            match = STATEMENTS.search(timing)
+            if match:
+                statements.append(int(match.group(1)))
+            if status not in (200, 201):
+                errors[str(status)] = errors.get(str(status), 0) + 1
+            elif phase.save:
+                key, field = phase.save
+                state[key].append(json.loads(content)[field])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(one, range(count)))
+    wall = time.perf_counter() - start
+
+    ordered = sorted(timings)
+    milliseconds = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50_ms': milliseconds(percentile(ordered, 50)),
+        'p95_ms': milliseconds(percentile(ordered, 95)),
+        'p99_ms': milliseconds(percentile(ordered, 99)),
+        'max_ms': milliseconds(ordered[-1] if ordered else None),
+        'throughput_rps': round(count / wall, 1) if wall else None,
+        'statements_per_request': round(sum(statements) / len(statements), 2) if statements else None,
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Load test every route of the STC API.')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='server to load in http mode (default: serve the app in-process)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='concurrent requests (default: 1 in client mode, 8 in http mode)')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--routes', help='only run routes whose name contains this text')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--no-seed', dest='seed', action='store_false',
+                        help='use the rows already in DATABASE_URL')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--answers', type=int, default=5, help='answers per question, on average')
+    parser.add_argument('--votes', type=int, default=3, help='votes per answer')
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--random-seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.workers is None:
+        args.workers = 1 if args.mode == 'client' else 8
+    if args.url and args.mode != 'http':
+        parser.error('--url needs --mode http')
+    if args.seed and args.users < 3:
+        parser.error('--users must be at least 3: member2 is the manager the routes run as')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts, state = prepare(args)
+
+    server = None
+    if args.mode == 'client':
+        # Over budget, a view fails with an AssertionError, counted as a 500.
+        app.config['ENFORCE_STATEMENT_BUDGETS'] = True
+        transport = ClientTransport()
+    else:
+        url = args.url
+        if url is None:
+            server, url = serve()
+        transport = HTTPTransport(url)
+
+    try:
+        status, _, content = transport.request('GET', '/token', None, {'Authorization': basic('member2')})
+        if status != 200:
+            print(f'could not log in as member2: {status} {content[:200]!r}', file=sys.stderr)
+            return 1
+        token = json.loads(content)['token']
+
+        routes = {}
+        for phase in PHASES:
+            if args.routes and args.routes not in phase.name:
+                continue
+            routes[phase.name] = run_phase(phase, transport, state, token, args)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'environment': {
+            'revision': revision(),
+            'database': state['dialect'],
+            'mode': args.mode,
+            'url': args.url,
+            'workers': args.workers,
+            'requests_per_route': args.requests,
+            'python': platform.python_version(),
+        },
+        'rows': counts,
+        'routes': routes,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    failed = sum(sum(route['errors'].values()) for route in routes.values())
+    if failed:
+        print(f'{failed} request(s) failed', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
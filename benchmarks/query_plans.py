@@ -0,0 +1,172 @@
+"""
+Query-plan regression check.
+
+Seeds a database, calls each endpoint below, and runs EXPLAIN on every
+statement the endpoint issued. Fails when a plan reads a whole large table,
+by a sequential scan or by walking a whole index: only index searches pass.
+Views are held to their @statement_budget (ENFORCE_STATEMENT_BUDGETS), and an
+endpoint that fails also fails the check.
+
+Listings are checked past their first page. Without a cursor, a page is an
+ordered index walk that only the LIMIT stops, which SQLite reports as a
+full SCAN.
+
+    python benchmarks/query_plans.py
+
+Runs against a SQLite file unless DATABASE_URL is set. Against PostgreSQL,
+point DATABASE_URL at a scratch database: its tables are dropped and reseeded.
+"""
+import os
+import re
+import sys
+import json
+import base64
+import tempfile
+
+DATABASE = os.path.join(tempfile.gettempdir(), 'stc_query_plans.db')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + DATABASE)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import select, text
+
+from app import create_app
+from database.models import db, Question, Answer
+from database.seed import seed
+from database.statements import StatementCounter
+from search import INDEXES
+
+app = create_app({'ENFORCE_STATEMENT_BUDGETS': True})
+
+# Tables that grow with usage; a sequential scan on any of them is a regression.
+LARGE_TABLES = {'user', 'question', 'question_tag', 'answer', 'vote', 'article'}
+PASSWORD = 'password'
+
+# (method, path, authenticated). {question}, {answer} and {user} are filled
+# from the seeded rows, and {cursor} with the cursor of the path's first page.
+ENDPOINTS = [
+    ('GET', '/questions?after={cursor}', False),
+    ('GET', '/questions?sort=newest&after={cursor}', False),
+    ('GET', '/questions?sort=top&after={cursor}', False),
+    ('GET', '/questions/{question}', False),
+    ('GET', '/questions/{question}/answers', False),
+    ('GET', '/questions/{question}/answers?sort=top', False),
+    ('GET', '/tags/tag1/questions?after={cursor}', False),
+    ('GET', '/tags/tag1/questions?sort=newest&after={cursor}', False),
+    ('GET', '/search-questions/?search=question', False),
+    ('GET', '/articles?after={cursor}', False),
+    ('GET', '/articles?sort=newest&after={cursor}', False),
+    ('GET', '/articles/1', False),
+    ('GET', '/search-articles/?author=member1', False),
+    ('GET', '/answers/{answer}/upvote', True),
+    ('GET', '/answers/{answer}/downvote', True),
+    ('DELETE', '/questions/{question}', True),
+]
+
+# A SCAN reads the whole table, or the whole of the index it names.
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'postgresql':
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        return list(postgres_scans(plan[0]['Plan']))
+
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    scans = []
+    for row in rows:
+        match = SQLITE_SCAN.match(row[-1])
+        if match:
+            # Aliased tables are reported as e.g. user_1.
+            scans.append(re.sub(r'_\d+$', '', match.group(1)))
+    return scans
+
+
+def postgres_scans(node):
+    if node['Node Type'] == 'Seq Scan':
+        yield node['Relation Name']
+    elif node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node:
+        yield node['Relation Name']
+    for child in node.get('Plans', []):
+        yield from postgres_scans(child)
+
+
+def prepare():
+    db.drop_all()
+    db.create_all()
+    counts = seed(users=2000, questions=20000, articles=5000)
+    # Fresh statistics, so the planner sees the seeded table sizes.
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+    # Without PostgreSQL, search runs on in-process indexes; their one-off
+    # load reads whole tables by design and is not part of any request.
+    for index in INDEXES.values():
+        index.reset()
+        if db.engine.dialect.name != 'postgresql':
+            index.load()
+
+    # A question with answers, and an answer its asker did not write.
+    question, user = db.session.execute(
+        select(Question.id, Question.user_id).where(Question.answer_count > 0).limit(1)).one()
+    answer = db.session.execute(
+        select(Answer.id).where(Answer.user_id != user).limit(1)).scalar()
+    username = db.session.execute(text('SELECT username FROM "user" WHERE id = :id'), {'id': user}).scalar()
+    return counts, {'question': question, 'answer': answer, 'user': username}
+
+
+def first_page_cursor(client, path, values):
+    # Empty when the first page fails, which then fails the checked page too.
+    first = re.sub(r'[?&]after=\{cursor\}', '', path).format(**values)
+    response = client.get(first)
+    return response.get_json()['next_cursor'] if response.status_code == 200 else ''
+
+
+def main():
+    client = app.test_client()
+
+    with app.app_context():
+        counts, values = prepare()
+
+    credentials = base64.b64encode(f"{values['user']}:{PASSWORD}".encode()).decode()
+    token = client.get('/token', headers={'Authorization': 'Basic ' + credentials}).get_json()['token']
+
+    report, failures = [], 0
+    for method, path, authenticated in ENDPOINTS:
+        cursor = first_page_cursor(client, path, values) if '{cursor}' in path else None
+        path = path.format(cursor=cursor, **values)
+        headers = {'Authorization': 'Bearer ' + token} if authenticated else {}
+
+        with app.app_context():
+            with StatementCounter() as counter:
+                response = client.open(path, method=method, headers=headers)
+
+            scans = []
+            connection = db.session.connection()
+            for statement, parameters in zip(counter.statements, counter.parameters):
+                if not re.match(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', statement, re.I):
+                    continue
+                if isinstance(parameters, list):
+                    continue
+                scans.extend(table for table in explain(connection, statement, parameters)
+                             if table in LARGE_TABLES)
+            db.session.rollback()
+
+        # A view over its statement budget fails with a 500.
+        failures += bool(scans) or response.status_code != 200
+        report.append({
+            'request': f'{method} {path}',
+            'status': response.status_code,
+            'statements': counter.count,
+            'full_scans': scans,
+        })
+
+    print(json.dumps({'rows': counts, 'endpoints': report}, indent=2))
+
+    if failures:
+        print(f'{failures} endpoint(s) failed or read a whole large table or index', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Regression benchmark for GET /search-articles/.
+
+The article search used to filter on user.username without joining it to
+article, so its cost grew with articles x users. This benchmark times the
+author search, which joins article to user through the username index, in
+three series: growing the user table and then other authors' articles while
+the matched rows stay fixed, and growing the matched rows. It fails when
+either of the first two is not flat, or when the third grows faster than the
+matched rows.
+
+    python benchmarks/search_articles.py
+
+Runs against an in-memory SQLite database unless DATABASE_URL is set.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import statistics
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from sqlalchemy import insert
+
+from app import create_app
+from database.models import db, User, Article
+
+app = create_app()
+
+# Users named needle<n>, who write the matched articles.
+AUTHORS = 5
+REPEAT = 50
+# Allowed slowdown while the user table, or the other articles, grow 16-20x
+# with a fixed match count.
+MAX_USER_GROWTH_RATIO = 2.0
+MAX_OTHERS_GROWTH_RATIO = 2.0
+# Allowed slowdown per matched row while the matched rows grow 16x.
+MAX_MATCH_GROWTH_RATIO = 1.5
+
+
+def seed(users, matched, others):
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(User), [{
+        'username': f'needle{i}' if i < AUTHORS else f'member{i}',
+        'password': 'x',
+        'role': 'staff',
+    } for i in range(users)])
+
+    db.session.execute(insert(Article), [{
+        'title': f'article {i}',
+        'body': f'body {i}',
+        # The matched articles come last, where a walk in date order finds them.
+        'user_id': 1 + (i % AUTHORS if i >= others else AUTHORS + i % (users - AUTHORS)),
+    } for i in range(others + matched)])
+    db.session.commit()
+
+
+def measure(client, users, matched, others=1000):
+    with app.app_context():
+        seed(users, matched, others)
+
+    client.get('/search-articles/?author=needle')
+
+    timings = []
+    for _ in range(REPEAT):
+        # As timeit does: collections would land on runs at random.
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            response = client.get('/search-articles/?author=needle')
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        assert response.status_code == 200
+
+    return {
+        'users': users,
+        'matched': matched,
+        'others': others,
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+    }
+
+
+def main():
+    client = app.test_client()
+
+    by_users = [measure(client, users, 200) for users in (1000, 5000, 20000)]
+    by_others = [measure(client, 1000, 200, others) for others in (1000, 4000, 16000)]
+    by_matches = [measure(client, 1000, matched) for matched in (200, 800, 3200)]
+
+    user_ratio = by_users[-1]['median_ms'] / by_users[0]['median_ms']
+    others_ratio = by_others[-1]['median_ms'] / by_others[0]['median_ms']
+    # Slowdown beyond the growth of the matched rows themselves.
+    match_ratio = ((by_matches[-1]['median_ms'] / by_matches[0]['median_ms'])
+                   / (by_matches[-1]['matched'] / by_matches[0]['matched']))
+    print(json.dumps({
+        'by_users': by_users,
+        'by_others': by_others,
+        'by_matches': by_matches,
+        'user_growth_ratio': round(user_ratio, 2),
+        'others_growth_ratio': round(others_ratio, 2),
+        'match_growth_ratio': round(match_ratio, 2),
+    }, indent=2))
+
+    failed = False
+    if user_ratio > MAX_USER_GROWTH_RATIO:
+        print(f'search-articles cost grew {user_ratio:.2f}x with the user table', file=sys.stderr)
+        failed = True
+    if others_ratio > MAX_OTHERS_GROWTH_RATIO:
+        print(f"search-articles cost grew {others_ratio:.2f}x with other authors' articles",
+              file=sys.stderr)
+        failed = True
+    if match_ratio > MAX_MATCH_GROWTH_RATIO:
+        print(f'search-articles cost grew {match_ratio:.2f}x faster than the matched rows',
+              file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Serialization throughput for a listing of 10k questions.
+
+Loads the questions once, then times only turning them into a JSON body:
+`short_format()` dicts of entities through Flask's standard provider (the old
+path) against QuestionSummary rows built from the projected listing query
+through the orjson provider, plus the two mixed combinations.
+
+    python benchmarks/serialization.py
+
+Runs against an in-memory SQLite database unless DATABASE_URL is set.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import statistics
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app
+from database.models import db, Question
+from database.loading import load, QUESTION_LIST
+from database.projections import question_summaries, question_tags
+from database.seed import seed
+from serialization import ORJSONProvider, StandardJSONProvider, QuestionSummary, orjson
+
+app = create_app()
+
+QUESTIONS = 10000
+REPEAT = 7
+
+
+def measure(provider, build, questions):
+    timings = []
+    for _ in range(REPEAT):
+        # As timeit does: a collection of the loaded rows would land on
+        # whichever run happened to trigger it.
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            body = provider.dumps([build(question) for question in questions])
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    median = statistics.median(timings)
+    return {
+        'median_ms': round(median * 1000, 2),
+        'questions_per_second': round(len(questions) / median),
+        'bytes': len(body.encode()),
+    }
+
+
+def main():
+    if orjson is None:
+        print('orjson is not installed', file=sys.stderr)
+        return 1
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(users=500, questions=QUESTIONS, answers_per_question=0, articles=0)
+        questions = load(Question.query, QUESTION_LIST).order_by(Question.id).all()
+        rows = question_summaries().order_by(Question.id).all()
+        tags = question_tags([row.id for row in rows])
+        summary = lambda row: QuestionSummary.from_row(row, tags[row.id])
+
+        # Flask's stock provider sorts keys, as jsonify did before.
+        standard = DefaultJSONProvider(app)
+        unsorted = StandardJSONProvider(app)
+        fast = ORJSONProvider(app)
+
+        results = {
+            'before: dicts + stdlib json': measure(standard, Question.short_format, questions),
+            'dicts + orjson': measure(fast, Question.short_format, questions),
+            'rows + stdlib json': measure(unsorted, summary, rows),
+            'after: rows + orjson': measure(fast, summary, rows),
+        }
+
+    before = results['before: dicts + stdlib json']['median_ms']
+    after = results['after: rows + orjson']['median_ms']
+    print(json.dumps({
+        'questions': len(questions),
+        'results': results,
+        'speedup': round(before / after, 2),
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
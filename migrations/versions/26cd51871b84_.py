@@ -0,0 +1,39 @@
+"""answer vote counters
+
+Revision ID: 26cd51871b84
+Revises: 82ec864f35af
+Create Date: 2026-10-18 09:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '26cd51871b84'
+down_revision = '82ec864f35af'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('answer', sa.Column('upvote_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('answer', sa.Column('downvote_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill the tallies from the existing votes.
+    op.execute("""
+        UPDATE answer SET
+            upvote_count = (
+                SELECT count(*) FROM vote
+                WHERE vote.answer_id = answer.id AND vote.upvote = true
+            ),
+            downvote_count = (
+                SELECT count(*) FROM vote
+                WHERE vote.answer_id = answer.id AND vote.downvote = true
+            )
+    """)
+
+
+def downgrade():
+    op.drop_column('answer', 'downvote_count')
+    op.drop_column('answer', 'upvote_count')
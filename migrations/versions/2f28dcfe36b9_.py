@@ -0,0 +1,81 @@
+"""real timestamps and answer counts
+
+Revision ID: 2f28dcfe36b9
+Revises: 62c666cfe325
+Create Date: 2026-10-18 16:21:05.114203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f28dcfe36b9'
+down_revision = '62c666cfe325'
+branch_labels = None
+depends_on = None
+
+
+# The old columns hold strings written with "%B %d, %Y | %H:%M:%S".
+STAMP_FORMAT = 'FMMonth DD, YYYY | HH24:MI:SS'
+
+STAMPED = {
+    'question': {'created_at': 'created_on', 'updated_at': 'created_on'},
+    'answer': {'created_at': 'created_on', 'updated_at': 'created_on'},
+    'article': {'created_at': 'created_on', 'updated_at': 'updated_on'},
+}
+
+
+def upgrade():
+    for table, columns in STAMPED.items():
+        for column, source in columns.items():
+            op.add_column(table, sa.Column(column, sa.DateTime(timezone=True),
+                                           server_default=sa.text('now()'), nullable=False))
+            op.execute(
+                f"UPDATE {table} SET {column} = to_timestamp({source}, '{STAMP_FORMAT}') "
+                f"WHERE {source} IS NOT NULL AND {source} <> ''"
+            )
+
+    op.add_column('question', sa.Column('answer_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE question SET answer_count = counts.total FROM '
+        '(SELECT question_id, count(*) AS total FROM answer GROUP BY question_id) AS counts '
+        'WHERE counts.question_id = question.id'
+    )
+
+    op.create_index('ix_question_created_at_id', 'question', ['created_at', 'id'])
+    op.create_index('ix_question_answer_count_id', 'question', ['answer_count', 'id'])
+    op.create_index('ix_answer_question_id_created_at_id', 'answer', ['question_id', 'created_at', 'id'])
+    op.create_index('ix_answer_question_id_upvote_count_id', 'answer', ['question_id', 'upvote_count', 'id'])
+    op.create_index('ix_article_created_at_id', 'article', ['created_at', 'id'])
+    op.create_index('ix_article_updated_at_id', 'article', ['updated_at', 'id'])
+
+    op.drop_column('question', 'created_on')
+    op.drop_column('answer', 'created_on')
+    op.drop_column('article', 'created_on')
+    op.drop_column('article', 'updated_on')
+
+
+def downgrade():
+    op.add_column('question', sa.Column('created_on', sa.VARCHAR(length=80), autoincrement=False, nullable=True))
+    op.add_column('answer', sa.Column('created_on', sa.VARCHAR(length=80), autoincrement=False, nullable=True))
+    op.add_column('article', sa.Column('created_on', sa.VARCHAR(length=80), autoincrement=False, nullable=True))
+    op.add_column('article', sa.Column('updated_on', sa.VARCHAR(length=80), autoincrement=False, nullable=True))
+
+    for table, columns in STAMPED.items():
+        for column, source in columns.items():
+            if column == 'updated_at' and source == 'created_on':
+                continue
+            op.execute(f"UPDATE {table} SET {source} = to_char({column}, '{STAMP_FORMAT}')")
+
+    op.drop_index('ix_article_updated_at_id', table_name='article')
+    op.drop_index('ix_article_created_at_id', table_name='article')
+    op.drop_index('ix_answer_question_id_upvote_count_id', table_name='answer')
+    op.drop_index('ix_answer_question_id_created_at_id', table_name='answer')
+    op.drop_index('ix_question_answer_count_id', table_name='question')
+    op.drop_index('ix_question_created_at_id', table_name='question')
+
+    op.drop_column('question', 'answer_count')
+    for table, columns in STAMPED.items():
+        for column in columns:
+            op.drop_column(table, column)
@@ -0,0 +1,49 @@
+"""full-text search vectors
+
+Revision ID: 3b9dbbd62018
+Revises: 926d25833328
+Create Date: 2026-10-18 11:26:50.184417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9dbbd62018'
+down_revision = '926d25833328'
+branch_labels = None
+depends_on = None
+
+
+QUESTION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tag, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+ARTICLE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+
+def upgrade():
+    op.execute(
+        'ALTER TABLE question ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({QUESTION_SEARCH_VECTOR}) STORED'
+    )
+    op.create_index('ix_question_search_vector', 'question', ['search_vector'], postgresql_using='gin')
+
+    op.execute(
+        'ALTER TABLE article ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({ARTICLE_SEARCH_VECTOR}) STORED'
+    )
+    op.create_index('ix_article_search_vector', 'article', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_article_search_vector', table_name='article')
+    op.drop_column('article', 'search_vector')
+    op.drop_index('ix_question_search_vector', table_name='question')
+    op.drop_column('question', 'search_vector')
@@ -0,0 +1,39 @@
+"""foreign key lookup indexes
+
+Revision ID: 586b7d82b732
+Revises: 2f28dcfe36b9
+Create Date: 2026-10-18 17:02:41.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '586b7d82b732'
+down_revision = '2f28dcfe36b9'
+branch_labels = None
+depends_on = None
+
+
+# answer.question_id and vote.user_id already lead the pagination and
+# one-vote-per-user indexes, so only the remaining foreign keys are added.
+INDEXES = [
+    ('ix_question_user_id_created_at_id', 'question', ['user_id', 'created_at', 'id']),
+    ('ix_answer_user_id', 'answer', ['user_id']),
+    ('ix_vote_answer_id_upvote_downvote', 'vote', ['answer_id', 'upvote', 'downvote']),
+    ('ix_article_user_id_created_at_id', 'article', ['user_id', 'created_at', 'id']),
+]
+
+
+def upgrade():
+    # Built concurrently so that writes are not blocked on large tables.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
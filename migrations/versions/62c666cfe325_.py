@@ -0,0 +1,117 @@
+"""normalized question tags
+
+Revision ID: 62c666cfe325
+Revises: 6f6bede56118
+Create Date: 2026-10-18 15:08:44.927310
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62c666cfe325'
+down_revision = '6f6bede56118'
+branch_labels = None
+depends_on = None
+
+
+QUESTION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+OLD_QUESTION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tag, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(body, '')), 'B')"
+)
+
+
+def parse_tags(value):
+    try:
+        names = json.loads(value) if value else []
+    except ValueError:
+        names = [value]
+    if not isinstance(names, list):
+        names = [names]
+    return list(dict.fromkeys(str(name).strip().lower() for name in names if str(name).strip()))
+
+
+def upgrade():
+    tag = op.create_table('tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    question_tag = op.create_table('question_tag',
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['question_id'], ['question.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('question_id', 'tag_id')
+    )
+    op.create_index('ix_question_tag_tag_id_question_id', 'question_tag', ['tag_id', 'question_id'])
+
+    # Convert the JSON-encoded tag strings into rows.
+    connection = op.get_bind()
+    rows = connection.execute(sa.text('SELECT id, tag FROM question')).fetchall()
+
+    names = {}
+    for question_id, value in rows:
+        names[question_id] = parse_tags(value)
+
+    distinct = sorted({name for tags in names.values() for name in tags})
+    if distinct:
+        op.bulk_insert(tag, [{'name': name} for name in distinct])
+    ids = dict(connection.execute(sa.text('SELECT name, id FROM tag')).fetchall())
+
+    links = [{'question_id': question_id, 'tag_id': ids[name], 'position': position}
+             for question_id, tags in names.items()
+             for position, name in enumerate(tags)]
+    if links:
+        op.bulk_insert(question_tag, links)
+
+    # The search vector is generated from the tag column, so it goes first.
+    op.drop_index('ix_question_search_vector', table_name='question')
+    op.drop_column('question', 'search_vector')
+    op.drop_column('question', 'tag')
+    op.execute(
+        'ALTER TABLE question ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({QUESTION_SEARCH_VECTOR}) STORED'
+    )
+    op.create_index('ix_question_search_vector', 'question', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_question_search_vector', table_name='question')
+    op.drop_column('question', 'search_vector')
+    op.add_column('question', sa.Column('tag', sa.VARCHAR(length=150), autoincrement=False, nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.text(
+        'SELECT question_tag.question_id, tag.name FROM question_tag '
+        'JOIN tag ON tag.id = question_tag.tag_id '
+        'ORDER BY question_tag.question_id, question_tag.position'
+    )).fetchall()
+
+    tags = {}
+    for question_id, name in rows:
+        tags.setdefault(question_id, []).append(name)
+    for question_id, names in tags.items():
+        connection.execute(sa.text('UPDATE question SET tag = :tag WHERE id = :id'),
+                           {'tag': json.dumps(names), 'id': question_id})
+
+    op.execute(
+        'ALTER TABLE question ADD COLUMN search_vector tsvector '
+        f'GENERATED ALWAYS AS ({OLD_QUESTION_SEARCH_VECTOR}) STORED'
+    )
+    op.create_index('ix_question_search_vector', 'question', ['search_vector'], postgresql_using='gin')
+
+    op.drop_index('ix_question_tag_tag_id_question_id', table_name='question_tag')
+    op.drop_table('question_tag')
+    op.drop_table('tag')
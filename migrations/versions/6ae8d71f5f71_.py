@@ -0,0 +1,24 @@
+"""author name search index
+
+Revision ID: 6ae8d71f5f71
+Revises: 3b9dbbd62018
+Create Date: 2026-10-18 12:40:08.731265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6ae8d71f5f71'
+down_revision = '3b9dbbd62018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE INDEX ix_user_username_lower ON "user" (lower(username) text_pattern_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_user_username_lower', table_name='user')
@@ -0,0 +1,28 @@
+"""row versions for etags
+
+Revision ID: 6f6bede56118
+Revises: 6ae8d71f5f71
+Create Date: 2026-10-18 13:52:36.460981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f6bede56118'
+down_revision = '6ae8d71f5f71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('question', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('answer', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('article', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('article', 'version')
+    op.drop_column('answer', 'version')
+    op.drop_column('question', 'version')
@@ -0,0 +1,50 @@
+"""unique vote per user and answer
+
+Revision ID: 926d25833328
+Revises: 26cd51871b84
+Create Date: 2026-10-18 10:03:17.552904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '926d25833328'
+down_revision = '26cd51871b84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Concurrent clicks could store the same vote twice; keep the oldest row.
+    op.execute("""
+        DELETE FROM vote WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY user_id, answer_id ORDER BY id
+                ) AS position
+                FROM vote
+            ) AS ranked
+            WHERE ranked.position > 1
+        )
+    """)
+
+    # The tallies were backfilled with the duplicates included.
+    op.execute("""
+        UPDATE answer SET
+            upvote_count = (
+                SELECT count(*) FROM vote
+                WHERE vote.answer_id = answer.id AND vote.upvote = true
+            ),
+            downvote_count = (
+                SELECT count(*) FROM vote
+                WHERE vote.answer_id = answer.id AND vote.downvote = true
+            )
+    """)
+
+    op.create_index('ix_vote_user_id_answer_id', 'vote', ['user_id', 'answer_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_vote_user_id_answer_id', table_name='vote')
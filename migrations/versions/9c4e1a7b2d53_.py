@@ -0,0 +1,24 @@
+"""user versions for etags
+
+Revision ID: 9c4e1a7b2d53
+Revises: 586b7d82b732
+Create Date: 2026-10-18 19:12:08.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1a7b2d53'
+down_revision = '586b7d82b732'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'version')